@@ -0,0 +1,250 @@
+"""
+AI provider interface.
+
+The Gemini SDK is heavy to import, so it is only loaded the first time a
+provider actually generates content (or when warm() is called from a
+preloading parent process).
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+DEFAULT_MODEL = 'gemini-flash-latest'
+
+_sdk = None
+_sdk_lock = threading.Lock()
+
+
+class AIUnavailable(Exception):
+    """Raised when an AI call is refused or abandoned. Carries the HTTP status to return."""
+    status_code = 503
+
+
+class CircuitOpenError(AIUnavailable):
+    status_code = 503
+
+
+class AITimeoutError(AIUnavailable):
+    status_code = 504
+
+
+class AIContentError(Exception):
+    """
+    The model answered but gave nothing usable (blocked or empty response).
+    Says nothing about the upstream's health, so it never trips the breaker.
+    """
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker. After `failure_threshold`
+    consecutive failures, calls fail fast for `reset_timeout` seconds, then a
+    single trial call is let through to probe the upstream.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed"""
+        if self.opened_at is None:
+            return 0
+        return max(0, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('AI_BREAKER_FAILURES', 3)),
+    reset_timeout=float(os.getenv('AI_BREAKER_RESET_SECONDS', 30))
+)
+
+# The SDK has no per-call timeout, so calls run on a small pool and the request
+# thread stops waiting at the deadline. A hung call keeps its pool thread until
+# it returns, which the breaker limits by failing fast.
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv('AI_TIMEOUT_SECONDS', 20))
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('AI_MAX_THREADS', 4)),
+                               thread_name_prefix='ai-call')
+
+
+def _load_sdk(api_key):
+    """Imports and configures google.generativeai once per process"""
+    global _sdk
+    if _sdk is None:
+        with _sdk_lock:
+            if _sdk is None:
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                _sdk = genai
+    return _sdk
+
+
+class AIProvider:
+    """Minimal interface the app needs from a text generation backend"""
+    name = 'base'
+
+    def generate(self, prompt):
+        """Returns the raw text response for a prompt"""
+        raise NotImplementedError
+
+    def warm(self):
+        """Loads anything expensive up front. Optional."""
+        pass
+
+    def is_upstream_failure(self, exc):
+        """True if exc means the service is unhealthy (network, 5xx, throttling) rather than a bad answer"""
+        return isinstance(exc, (ConnectionError, TimeoutError, OSError))
+
+
+class GeminiProvider(AIProvider):
+    name = 'gemini'
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+
+    def _get_model(self):
+        if self._model is None:
+            genai = _load_sdk(self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def warm(self):
+        self._get_model()
+
+    def generate(self, prompt):
+        model = self._get_model()
+        try:
+            response = model.generate_content(prompt)
+        except (_sdk.types.BlockedPromptException, _sdk.types.StopCandidateException) as e:
+            raise AIContentError(str(e)) from e
+        try:
+            return response.text
+        except ValueError as e:
+            # 0.3.2 raises ValueError from .text when the candidate was blocked or empty
+            raise AIContentError(str(e)) from e
+
+    def is_upstream_failure(self, exc):
+        if super().is_upstream_failure(exc):
+            return True
+        # Only reached after generate() ran, so the SDK is already imported
+        from google.api_core import exceptions as api_exceptions
+        return isinstance(exc, (api_exceptions.ServerError, api_exceptions.TooManyRequests,
+                                api_exceptions.RetryError))
+
+
+class FakeProvider(AIProvider):
+    """
+    Offline stand-in for scripts and tests. `responder(prompt)` builds the
+    reply text; `failure_rate` makes a share of calls raise so retry paths
+    can be exercised without a network.
+    """
+    name = 'fake'
+
+    def __init__(self, responder, latency=0.0, failure_rate=0.0, seed=None):
+        self.responder = responder
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError('Simulated AI outage')
+        return self.responder(prompt)
+
+
+_provider = None
+
+
+def get_provider():
+    """Returns the configured provider, or None if no API key is set"""
+    global _provider
+    if _provider is None:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            return None
+        _provider = GeminiProvider(api_key)
+    return _provider
+
+
+def set_provider(provider):
+    """Overrides the process-wide provider (used by scripts and offline runs)"""
+    global _provider
+    _provider = provider
+
+
+def call(provider, prompt, timeout=None):
+    """
+    Runs provider.generate() behind the circuit breaker with a client-side deadline.
+    Raises CircuitOpenError or AITimeoutError instead of blocking the worker.
+    Only timeouts and provider.is_upstream_failure() errors count against the
+    breaker; anything else (e.g. AIContentError for a blocked answer) is raised
+    as-is and counts as a healthy response.
+    """
+    if not breaker.allow():
+        raise CircuitOpenError('AI service is temporarily unavailable. Please try again shortly.')
+
+    future = _executor.submit(provider.generate, prompt)
+    try:
+        text = future.result(timeout=timeout or DEFAULT_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        future.cancel()
+        breaker.record_failure()
+        raise AITimeoutError('AI service did not respond in time.')
+    except Exception as e:
+        if provider.is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    breaker.record_success()
+    return text
+
+
+def warm():
+    """Imports the SDK ahead of time if a provider is configured"""
+    provider = get_provider()
+    if provider:
+        provider.warm()
+    return provider
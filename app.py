@@ -1,22 +1,42 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask.json.provider import DefaultJSONProvider
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash, has_request_context, g
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 import os
+import secrets
+import threading
+import time
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-import google.generativeai as genai
+from werkzeug.exceptions import HTTPException, BadRequest
+from werkzeug.datastructures import MultiDict
+from werkzeug.routing import RequestRedirect
+from urllib.parse import urlsplit, parse_qsl
 import json
+from decimal import Decimal, InvalidOperation
+from datetime import date, datetime
 from dotenv import load_dotenv
+import ai_provider
+import query_sampler
 
 load_dotenv()
 
+class IsoJSONProvider(DefaultJSONProvider):
+    """Dates go out as ISO 8601, matching the server-rendered tables (Flask's default is an HTTP date)"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = IsoJSONProvider(app)
 app.secret_key = 'your_very_secure_secret_key' # Change this in production!
 
 # --- GEMINI CONFIGURATION ---
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# GEMINI_API_KEY is read by ai_provider, which imports the SDK lazily on first use.
 
 # --- DATABASE CONFIGURATION ---
 # Check for Render's DATABASE_URL first, fallback to local config
@@ -35,32 +55,205 @@ else:
     }
 
 
-def get_db_connection():
-    """Establishes connection to PostgreSQL"""
+# --- TIME BUDGETS ---
+# Every connection gets a server-side statement_timeout so a slow query can't hold
+# a worker forever. Endpoints that legitimately scan more get a bigger budget.
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv('DB_CONNECT_TIMEOUT_SECONDS', 5))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 5000))
+ENDPOINT_DB_TIMEOUTS_MS = {
+    'batch': 8000,
+    'check_hazards': 10000,
+    'ai_search': 10000,
+}
+
+# Client-side deadlines (seconds) for the Gemini call made by each AI endpoint
+ENDPOINT_AI_TIMEOUTS = {
+    'ai_lookup': 10,
+    'ai_search': 15,
+    'check_hazards': 25,
+}
+
+class DatabaseUnavailable(Exception):
+    """Raised when a connection to PostgreSQL can't be established"""
+    pass
+
+def get_statement_timeout_ms():
+    if has_request_context():
+        return ENDPOINT_DB_TIMEOUTS_MS.get(request.endpoint, DB_STATEMENT_TIMEOUT_MS)
+    return DB_STATEMENT_TIMEOUT_MS
+
+def get_db_connection(statement_timeout_ms=None):
+    """Establishes connection to PostgreSQL with the current endpoint's statement_timeout"""
+    if statement_timeout_ms is None:
+        statement_timeout_ms = get_statement_timeout_ms()
+    options = {
+        'connection_factory': query_sampler.SampledConnection,
+        'connect_timeout': DB_CONNECT_TIMEOUT_SECONDS,
+        'options': f'-c statement_timeout={int(statement_timeout_ms)}'
+    }
     try:
         if isinstance(db_config, str):
             # DATABASE_URL is a string
-            conn = psycopg2.connect(db_config)
+            conn = psycopg2.connect(db_config, **options)
         else:
             # db_config is a dictionary
-            conn = psycopg2.connect(**db_config)
+            conn = psycopg2.connect(**db_config, **options)
         return conn
     except Exception as e:
         print(f"Error connecting to PostgreSQL: {e}")
+        raise DatabaseUnavailable(str(e)) from e
+
+query_sampler.configure(lambda: get_db_connection(statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS))
+
+# --- ERROR HANDLERS ---
+
+def service_error(message, status, retry_after=None):
+    """JSON for API calls, plain text for pages"""
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': message})
+    else:
+        response = app.response_class(message, mimetype='text/plain')
+    response.status_code = status
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.errorhandler(DatabaseUnavailable)
+def handle_database_unavailable(e):
+    return service_error('Database is unavailable. Please try again shortly.', 503, retry_after=5)
+
+@app.errorhandler(psycopg2.errors.QueryCanceled)
+def handle_query_canceled(e):
+    print(f"Query exceeded time budget on {request.endpoint}: {e}")
+    return service_error('The request took too long and was cancelled.', 504)
+
+@app.errorhandler(ai_provider.AIUnavailable)
+def handle_ai_unavailable(e):
+    retry_after = ai_provider.breaker.retry_after() if isinstance(e, ai_provider.CircuitOpenError) else None
+    return service_error(str(e), e.status_code, retry_after=retry_after)
+
+# Errors the handlers above turn into 503/504
+SERVICE_ERRORS = (DatabaseUnavailable, psycopg2.errors.QueryCanceled, ai_provider.AIUnavailable)
+
+def reraise_service_errors(e):
+    """Views with a catch-all `except Exception` call this first so 503/504s still reach their handlers"""
+    if isinstance(e, SERVICE_ERRORS):
+        raise e
+
+def unexpected_error(label, e, message=None):
+    """Catch-all for API views: logs and returns a 500, except for SERVICE_ERRORS"""
+    reraise_service_errors(e)
+    print(f"{label}: {e}")
+    return jsonify({'error': message or str(e)}), 500
+
+# --- LOAD SHEDDING ---
+# AI endpoints are slow and optional, so they are refused first when this worker
+# is backed up. CRUD traffic is never shed here.
+# - AI_MAX_CONCURRENCY caps concurrent AI requests per worker. This only bites with
+#   threaded workers (render.yaml runs gthread with 4 threads), so the remaining
+#   threads stay free for CRUD; a sync worker never has two requests in flight.
+# - If the proxy sets X-Request-Start, requests that already queued longer than
+#   SHED_QUEUE_MS are rejected before doing any work. Render's proxy isn't known to
+#   set it, so there this check is inactive unless one is put in front.
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 2))
+SHED_QUEUE_MS = int(os.getenv('SHED_QUEUE_MS', 2000))
+_ai_slots = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+
+def get_queue_delay_ms():
+    """Time spent queued before reaching the worker, from X-Request-Start (t=<epoch>) if present"""
+    header = request.headers.get('X-Request-Start', '')
+    raw = header[2:] if header.startswith('t=') else header
+    try:
+        started = float(raw)
+    except ValueError:
         return None
+    # Proxies send seconds, milliseconds or microseconds; normalise to seconds
+    while started > 1e11:
+        started /= 1000.0
+    return max(0.0, (time.time() - started) * 1000)
 
 # --- AUTH DECORATOR ---
+# Every inventory query is scoped to the user's lab. The lab is stored in the
+# session at login and exposed to the request as g.lab_id.
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             flash('Please login to access this page.', 'warning')
             return redirect(url_for('login'))
+        if 'lab_id' not in session:
+            # Session from before labs existed: make the user log in again
+            session.clear()
+            flash('Please login again.', 'warning')
+            return redirect(url_for('login'))
+        g.lab_id = session['lab_id']
         return f(*args, **kwargs)
     return decorated_function
 
+def current_lab_id():
+    return g.lab_id
+
+# Comma-separated usernames allowed to use the /api/admin endpoints
+ADMIN_USERNAMES = {u.strip() for u in os.getenv('ADMIN_USERNAMES', '').split(',') if u.strip()}
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('username') not in ADMIN_USERNAMES:
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+# --- AI DECORATOR ---
+def ai_endpoint(f):
+    """
+    Guards an AI endpoint: requires a configured provider, fails fast while the
+    circuit breaker is open, and sheds load when the worker is backed up.
+    The provider is passed to the view as the `provider` keyword argument.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        provider = ai_provider.get_provider()
+        if not provider:
+            return jsonify({'error': 'Gemini API Key not configured. Please set GEMINI_API_KEY env var.'}), 503
+
+        if ai_provider.breaker.state == 'open':
+            raise ai_provider.CircuitOpenError('AI service is temporarily unavailable. Please try again shortly.')
+
+        queue_delay = get_queue_delay_ms()
+        if queue_delay is not None and queue_delay > SHED_QUEUE_MS:
+            return service_error('Server is busy. Please retry the AI request shortly.', 503, retry_after=2)
+
+        if not _ai_slots.acquire(blocking=False):
+            return service_error('Too many AI requests in progress. Please retry shortly.', 503, retry_after=2)
+        try:
+            return f(*args, provider=provider, **kwargs)
+        finally:
+            _ai_slots.release()
+    return decorated_function
+
 # --- AUTH ROUTES ---
 
+# Every new lab starts with these so chemicals and equipment can be placed right away
+DEFAULT_LOCATIONS = ['Flammables Cabinet', 'Refrigerator', 'General Shelf', 'Chemical Storage Room']
+
+def new_join_code():
+    return secrets.token_urlsafe(9)
+
+def create_lab(cursor, name):
+    """Creates a lab with its default locations. Returns None if the name is taken."""
+    cursor.execute("""
+        INSERT INTO labs (name, join_code) VALUES (%s, %s)
+        ON CONFLICT (name) DO NOTHING
+        RETURNING id
+    """, (name, new_join_code()))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    execute_values(cursor, "INSERT INTO locations (lab_id, name) VALUES %s",
+                   [(row[0], loc) for loc in DEFAULT_LOCATIONS])
+    return row[0]
+
 @app.route('/')
 def landing():
     if 'user_id' in session:
@@ -73,10 +266,15 @@ def signup():
         username = request.form['username']
         password = request.form['password']
         confirm_password = request.form['confirm_password']
+        lab_name = (request.form.get('lab') or '').strip()
+        join_code = (request.form.get('join_code') or '').strip()
 
         if password != confirm_password:
             flash('Passwords do not match!', 'danger')
             return redirect(url_for('signup'))
+        if bool(lab_name) == bool(join_code):
+            flash('Enter either a name for a new lab or the join code of an existing one.', 'danger')
+            return redirect(url_for('signup'))
 
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -89,14 +287,28 @@ def signup():
             conn.close()
             return redirect(url_for('signup'))
 
-        # Create user
+        # Joining an existing lab needs its join code; a name always creates a new lab
         hashed_pw = generate_password_hash(password)
         try:
-            cursor.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s)", (username, hashed_pw))
+            if join_code:
+                cursor.execute("SELECT id FROM labs WHERE join_code = %s", (join_code,))
+                row = cursor.fetchone()
+                if row is None:
+                    flash('Invalid join code. Ask a member of the lab for the current one.', 'danger')
+                    return redirect(url_for('signup'))
+                lab_id = row[0]
+            else:
+                lab_id = create_lab(cursor, lab_name)
+                if lab_id is None:
+                    flash('A lab with that name already exists. Ask one of its members for the join code.', 'danger')
+                    return redirect(url_for('signup'))
+            cursor.execute("INSERT INTO users (username, password_hash, lab_id) VALUES (%s, %s, %s)",
+                           (username, hashed_pw, lab_id))
             conn.commit()
             flash('Account created! Please login.', 'success')
             return redirect(url_for('login'))
         except Exception as e:
+            reraise_service_errors(e)
             flash(f'Error creating account: {e}', 'danger')
         finally:
             cursor.close()
@@ -120,6 +332,7 @@ def login():
         if user and check_password_hash(user['password_hash'], password):
             session['user_id'] = user['id']
             session['username'] = user['username']
+            session['lab_id'] = user['lab_id']
             flash('Logged in successfully!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -138,17 +351,124 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('home.html')
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("SELECT name, join_code FROM labs WHERE id = %s", (current_lab_id(),))
+    lab = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return render_template('home.html', lab=lab)
+
+# The list pages embed their first page of rows (and the location list) so the
+# table paints without waiting on extra API round trips. JS pages in the rest.
+INITIAL_PAGE_SIZE = 50
+
+CHEMICALS_LIST_QUERY = """
+    SELECT c.*, l.name as location_name 
+    FROM {table} c 
+    LEFT JOIN locations l ON c.location_id = l.id
+    WHERE c.lab_id = %(lab_id)s
+      AND (%(before_id)s::int IS NULL OR (c.created_at, c.id) < (%(before_created_at)s::timestamp, %(before_id)s::int))
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+EQUIPMENTS_LIST_QUERY = """
+    SELECT e.*, l.name as location_name 
+    FROM {table} e 
+    LEFT JOIN locations l ON e.location_id = l.id
+    WHERE e.lab_id = %(lab_id)s
+      AND (%(before_id)s::int IS NULL OR (e.created_at, e.id) < (%(before_created_at)s::timestamp, %(before_id)s::int))
+    ORDER BY e.created_at DESC, e.id DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+def get_page_args(args=None):
+    """
+    Reads optional paging params for the list queries (no limit means all rows).
+    ?before_id=&before_created_at= continues after a known row, so rows added or
+    deleted since the first page can't shift the rest; ?offset= still works.
+    Returns (params, error) where error is a message for a 400.
+    """
+    if args is None:
+        args = request.args
+    limit = args.get('limit', type=int)
+    offset = args.get('offset', default=0, type=int)
+    if limit is not None and limit < 0:
+        limit = None
+    before_id = before_created_at = None
+    if 'before_id' in args or 'before_created_at' in args:
+        try:
+            before_id = int(args.get('before_id', ''))
+            before_created_at = datetime.fromisoformat(args.get('before_created_at', ''))
+        except ValueError:
+            return None, 'before_id and before_created_at must be given together as an integer and an ISO timestamp'
+    return {
+        'lab_id': current_lab_id(),
+        'limit': limit,
+        'offset': max(offset, 0),
+        'before_id': before_id,
+        'before_created_at': before_created_at
+    }, None
+
+def first_page_args():
+    return {'lab_id': current_lab_id(), 'limit': INITIAL_PAGE_SIZE, 'offset': 0,
+            'before_id': None, 'before_created_at': None}
 
 @app.route('/chemicals')
 @login_required
 def chemicals():
-    return render_template('chemicals.html')
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    lab_id = current_lab_id()
+    cursor.execute(CHEMICALS_LIST_QUERY.format(table='chemicals'), first_page_args())
+    rows = cursor.fetchall()
+    cursor.execute("""
+        SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE quantity < 50) AS low_stock
+        FROM chemicals
+        WHERE lab_id = %s
+    """, (lab_id,))
+    stats = cursor.fetchone()
+    locations, _ = read_locations(cursor, request.args)
+    cursor.close()
+    conn.close()
+
+    bootstrap = {
+        'chemicals': rows,
+        'locations': locations,
+        'total': stats['total'],
+        'low_stock': stats['low_stock']
+    }
+    return render_template('chemicals.html', chemicals=rows, locations=locations,
+                           stats=stats, bootstrap=bootstrap)
 
 @app.route('/equipment')
 @login_required
 def equipment():
-    return render_template('equipment.html')
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    lab_id = current_lab_id()
+    cursor.execute(EQUIPMENTS_LIST_QUERY.format(table='equipments'), first_page_args())
+    rows = cursor.fetchall()
+    cursor.execute("""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE status = 'Maintenance') AS in_maintenance,
+               COUNT(*) FILTER (WHERE status IN ('Broken', 'Retired')) AS broken
+        FROM equipments
+        WHERE lab_id = %s
+    """, (lab_id,))
+    stats = cursor.fetchone()
+    locations, _ = read_locations(cursor, request.args)
+    cursor.close()
+    conn.close()
+
+    bootstrap = {
+        'equipments': rows,
+        'locations': locations,
+        'total': stats['total']
+    }
+    return render_template('equipment.html', equipments=rows, locations=locations,
+                           stats=stats, bootstrap=bootstrap)
 
 @app.route('/equipment/form')
 @login_required
@@ -170,6 +490,84 @@ def orders():
 def resource_management():
     return render_template('resource_management.html')
 
+# --- READ HELPERS ---
+# Each GET endpoint's query lives here so /api/batch can run several of them on
+# one cursor. They take the query-string args and URL params, and return (body, status).
+
+def source_table(table, args):
+    """
+    Archived rows (see archive.py) are only read when explicitly asked for with
+    ?include_archived=1, via the <table>_all view.
+    """
+    if args.get('include_archived', '').lower() in ('1', 'true', 'yes'):
+        return f"{table}_all"
+    return table
+
+def read_chemicals(cursor, args):
+    page, error = get_page_args(args)
+    if error:
+        return {'error': error}, 400
+    cursor.execute(CHEMICALS_LIST_QUERY.format(table=source_table('chemicals', args)), page)
+    return cursor.fetchall(), 200
+
+def read_chemical(cursor, args, id):
+    cursor.execute(f"SELECT * FROM {source_table('chemicals', args)} WHERE id = %s AND lab_id = %s",
+                   (id, current_lab_id()))
+    chemical = cursor.fetchone()
+    if chemical:
+        return chemical, 200
+    return {'error': 'Chemical not found'}, 404
+
+def read_equipments(cursor, args):
+    page, error = get_page_args(args)
+    if error:
+        return {'error': error}, 400
+    cursor.execute(EQUIPMENTS_LIST_QUERY.format(table=source_table('equipments', args)), page)
+    return cursor.fetchall(), 200
+
+def read_equipment(cursor, args, id):
+    cursor.execute(f"SELECT * FROM {source_table('equipments', args)} WHERE id = %s AND lab_id = %s",
+                   (id, current_lab_id()))
+    equip = cursor.fetchone()
+    if equip:
+        return equip, 200
+    return {'error': 'Equipment not found'}, 404
+
+def read_locations(cursor, args):
+    cursor.execute("SELECT * FROM locations WHERE lab_id = %s ORDER BY id", (current_lab_id(),))
+    return cursor.fetchall(), 200
+
+def read_bookings(cursor, args):
+    cursor.execute(f"SELECT * FROM {source_table('bookings', args)} WHERE lab_id = %s ORDER BY booking_date DESC",
+                   (current_lab_id(),))
+    bookings = cursor.fetchall()
+    # Format date for JSON
+    for b in bookings:
+        if b['booking_date']:
+            b['booking_date'] = b['booking_date'].isoformat()
+    return bookings, 200
+
+def read_orders(cursor, args):
+    cursor.execute(f"SELECT * FROM {source_table('purchase_orders', args)} WHERE lab_id = %s ORDER BY order_date DESC",
+                   (current_lab_id(),))
+    orders = cursor.fetchall()
+    # Format date
+    for o in orders:
+        if o['order_date']:
+            o['order_date'] = o['order_date'].isoformat()
+    return orders, 200
+
+def run_read(reader, **view_args):
+    """Runs a read helper on its own connection for the single-resource endpoints"""
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        body, status = reader(cursor, request.args, **view_args)
+        return jsonify(body), status
+    finally:
+        cursor.close()
+        conn.close()
+
 # --- API ENDPOINTS (The "Bridge") ---
 # IMPORTANT: Ideally, APIs should also be protected or token-based. 
 # For now, we'll leave them open or protect them with session check if called from frontend.
@@ -181,36 +579,16 @@ def resource_management():
 @app.route('/api/chemicals', methods=['GET'])
 @login_required
 def get_chemicals():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    query = """
-        SELECT c.*, l.name as location_name 
-        FROM chemicals c 
-        LEFT JOIN locations l ON c.location_id = l.id
-        ORDER BY c.created_at DESC
-    """
-    cursor.execute(query)
-    chemicals = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    return jsonify(chemicals)
+    return run_read(read_chemicals)
 
 # 2. Get Single Chemical
 @app.route('/api/chemicals/<int:id>', methods=['GET'])
 @login_required
 def get_chemical(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM chemicals WHERE id = %s", (id,))
-    chemical = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if chemical:
-        return jsonify(chemical)
-    return jsonify({'error': 'Chemical not found'}), 404
+    return run_read(read_chemical, id=id)
+
+# Resolves a submitted location_id to NULL unless it belongs to the user's lab
+LAB_LOCATION = "(SELECT id FROM locations WHERE id = %s AND lab_id = %s)"
 
 # 3. Add or Update Chemical
 @app.route('/api/chemicals', methods=['POST'])
@@ -227,33 +605,33 @@ def save_chemical():
     loc_id = data.get('location_id')
     if not loc_id or loc_id == '':
         loc_id = None
+    lab_id = current_lab_id()
 
     try:
         if data.get('id'):
-            query = """
+            query = f"""
                 UPDATE chemicals 
                 SET name=%s, cas_number=%s, quantity=%s, unit=%s, 
-                    location_id=%s, expiry_date=%s, safety_notes=%s 
-                WHERE id=%s
+                    location_id={LAB_LOCATION}, expiry_date=%s, safety_notes=%s 
+                WHERE id=%s AND lab_id=%s
             """
             vals = (data['name'], data['cas_number'], data['quantity'], data['unit'], 
-                    loc_id, expiry, data['safety_notes'], data['id'])
+                    loc_id, lab_id, expiry, data['safety_notes'], data['id'], lab_id)
             cursor.execute(query, vals)
         else:
-            query = """
-                INSERT INTO chemicals (name, cas_number, quantity, unit, location_id, expiry_date, safety_notes)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            query = f"""
+                INSERT INTO chemicals (lab_id, name, cas_number, quantity, unit, location_id, expiry_date, safety_notes)
+                VALUES (%s, %s, %s, %s, %s, {LAB_LOCATION}, %s, %s)
             """
-            vals = (data['name'], data['cas_number'], data['quantity'], data['unit'], 
-                    loc_id, expiry, data['safety_notes'])
+            vals = (lab_id, data['name'], data['cas_number'], data['quantity'], data['unit'], 
+                    loc_id, lab_id, expiry, data['safety_notes'])
             cursor.execute(query, vals)
 
         conn.commit()
         return jsonify({'message': 'Success'}), 201
 
     except Exception as e:
-        print(f"ERROR SAVING CHEMICAL: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("ERROR SAVING CHEMICAL", e)
     
     finally:
         cursor.close()
@@ -265,45 +643,144 @@ def save_chemical():
 def delete_chemical(id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM chemicals WHERE id = %s", (id,))
+    cursor.execute("DELETE FROM chemicals WHERE id = %s AND lab_id = %s", (id, current_lab_id()))
     conn.commit()
     cursor.close()
     conn.close()
     return jsonify({'message': 'Deleted successfully'})
 
+# 5. Adjust Stock
+# quantity is changed server-side (quantity = quantity + delta) so concurrent
+# users can't overwrite each other, and stock can never go below zero.
+
+def parse_delta(value):
+    """Returns the delta as a Decimal, or None if it isn't a number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    try:
+        delta = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return delta if delta.is_finite() else None
+
+def apply_adjustments(cursor, deltas):
+    """
+    Applies {chemical_id: delta} to the current lab's chemicals in one UPDATE.
+    Returns (updated, errors) where errors lists the ids that don't exist or
+    would go negative.
+    """
+    lab_id = current_lab_id()
+    # UPDATE ... FROM (VALUES) locks rows in no particular order, so two batches
+    # touching the same chemicals could deadlock. Take the locks in id order first.
+    cursor.execute("SELECT id FROM chemicals WHERE id = ANY(%s) AND lab_id = %s ORDER BY id FOR UPDATE",
+                   (sorted(deltas), lab_id))
+    updated = execute_values(cursor, """
+        UPDATE chemicals c
+        SET quantity = c.quantity + v.delta, updated_at = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(id, delta, lab_id)
+        WHERE c.id = v.id AND c.lab_id = v.lab_id AND c.quantity + v.delta >= 0
+        RETURNING c.id, c.quantity, c.unit
+    """, [(chem_id, delta, lab_id) for chem_id, delta in deltas.items()],
+        template='(%s::int, %s::numeric, %s::int)', fetch=True)
+
+    missing = set(deltas) - {row['id'] for row in updated}
+    errors = []
+    if missing:
+        cursor.execute("SELECT id, quantity FROM chemicals WHERE id = ANY(%s) AND lab_id = %s",
+                       (list(missing), lab_id))
+        current = {row['id']: row['quantity'] for row in cursor.fetchall()}
+        for chem_id in sorted(missing):
+            if chem_id in current:
+                errors.append({'id': chem_id, 'error': 'Insufficient stock',
+                               'quantity': current[chem_id], 'delta': deltas[chem_id]})
+            else:
+                errors.append({'id': chem_id, 'error': 'Chemical not found'})
+    return updated, errors
+
+@app.route('/api/chemicals/<int:id>/quantity', methods=['PATCH'])
+@login_required
+def adjust_chemical_quantity(id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    delta = parse_delta(data.get('delta'))
+    if delta is None:
+        return jsonify({'error': 'delta must be a number'}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        updated, errors = apply_adjustments(cursor, {id: delta})
+        if errors:
+            conn.rollback()
+            status = 404 if errors[0]['error'] == 'Chemical not found' else 409
+            return jsonify(errors[0]), status
+        conn.commit()
+        return jsonify(updated[0])
+    except psycopg2.DataError as e:
+        # e.g. the new quantity overflows DECIMAL(10, 2)
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    finally:
+        cursor.close()
+        conn.close()
+
+@app.route('/api/chemicals/quantity', methods=['PATCH'])
+@login_required
+def adjust_chemical_quantities():
+    """
+    Batch version for end-of-day logging:
+    {"adjustments": [{"id": 3, "delta": -20}, {"id": 7, "delta": 500}]}
+    All adjustments are applied together or not at all.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    adjustments = data.get('adjustments')
+    if not isinstance(adjustments, list) or not adjustments:
+        return jsonify({'error': 'No adjustments provided'}), 400
+
+    # Several entries for the same chemical are summed into one delta
+    deltas = {}
+    for adj in adjustments:
+        if not isinstance(adj, dict):
+            return jsonify({'error': 'Each adjustment needs an id and a delta'}), 400
+        chem_id = adj.get('id')
+        delta = parse_delta(adj.get('delta'))
+        if isinstance(chem_id, bool) or not isinstance(chem_id, int) or delta is None:
+            return jsonify({'error': 'Each adjustment needs an integer id and a numeric delta'}), 400
+        deltas[chem_id] = deltas.get(chem_id, 0) + delta
+
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        updated, errors = apply_adjustments(cursor, deltas)
+        if errors:
+            conn.rollback()
+            return jsonify({'error': 'No adjustments were applied', 'failed': errors}), 409
+        conn.commit()
+        return jsonify({'message': 'Success', 'results': sorted(updated, key=lambda r: r['id'])})
+    except psycopg2.DataError as e:
+        # e.g. the new quantity overflows DECIMAL(10, 2)
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    finally:
+        cursor.close()
+        conn.close()
+
 # --- EQUIPMENT API ---
 
 # 1. Get All Equipments
 @app.route('/api/equipments', methods=['GET'])
 @login_required
 def get_equipments():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    query = """
-        SELECT e.*, l.name as location_name 
-        FROM equipments e 
-        LEFT JOIN locations l ON e.location_id = l.id
-        ORDER BY e.created_at DESC
-    """
-    cursor.execute(query)
-    equipments = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(equipments)
+    return run_read(read_equipments)
 
 # 2. Get Single Equipment
 @app.route('/api/equipments/<int:id>', methods=['GET'])
 @login_required
 def get_equipment_by_id(id):
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM equipments WHERE id = %s", (id,))
-    equip = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    if equip:
-        return jsonify(equip)
-    return jsonify({'error': 'Equipment not found'}), 404
+    return run_read(read_equipment, id=id)
 
 # 3. Add or Update Equipment
 @app.route('/api/equipments', methods=['POST'])
@@ -318,41 +795,41 @@ def save_equipment():
     lm_date = data.get('last_maintenance_date') or None
     nm_date = data.get('next_maintenance_date') or None
     loc_id = data.get('location_id') or None
+    lab_id = current_lab_id()
 
     try:
         if data.get('id'):
             # UPDATE
-            query = """
+            query = f"""
                 UPDATE equipments 
                 SET name=%s, model_number=%s, serial_number=%s, manufacturer=%s, 
-                    quantity=%s, location_id=%s, purchase_date=%s, 
+                    quantity=%s, location_id={LAB_LOCATION}, purchase_date=%s, 
                     last_maintenance_date=%s, next_maintenance_date=%s, 
                     status=%s, description=%s 
-                WHERE id=%s
+                WHERE id=%s AND lab_id=%s
             """
             vals = (data['name'], data['model_number'], data['serial_number'], data['manufacturer'],
-                    data['quantity'], loc_id, p_date, lm_date, nm_date, 
-                    data['status'], data['description'], data['id'])
+                    data['quantity'], loc_id, lab_id, p_date, lm_date, nm_date, 
+                    data['status'], data['description'], data['id'], lab_id)
             cursor.execute(query, vals)
         else:
             # INSERT
-            query = """
-                INSERT INTO equipments (name, model_number, serial_number, manufacturer, 
+            query = f"""
+                INSERT INTO equipments (lab_id, name, model_number, serial_number, manufacturer, 
                                      quantity, location_id, purchase_date, 
                                      last_maintenance_date, next_maintenance_date, 
                                      status, description)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, {LAB_LOCATION}, %s, %s, %s, %s, %s)
             """
-            vals = (data['name'], data['model_number'], data['serial_number'], data['manufacturer'],
-                    data['quantity'], loc_id, p_date, lm_date, nm_date, 
+            vals = (lab_id, data['name'], data['model_number'], data['serial_number'], data['manufacturer'],
+                    data['quantity'], loc_id, lab_id, p_date, lm_date, nm_date, 
                     data['status'], data['description'])
             cursor.execute(query, vals)
 
         conn.commit()
         return jsonify({'message': 'Success'}), 201
     except Exception as e:
-        print(f"ERROR SAVING EQUIPMENT: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("ERROR SAVING EQUIPMENT", e)
     finally:
         cursor.close()
         conn.close()
@@ -363,7 +840,7 @@ def save_equipment():
 def delete_equipment(id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM equipments WHERE id = %s", (id,))
+    cursor.execute("DELETE FROM equipments WHERE id = %s AND lab_id = %s", (id, current_lab_id()))
     conn.commit()
     cursor.close()
     conn.close()
@@ -374,13 +851,45 @@ def delete_equipment(id):
 @app.route('/api/locations', methods=['GET'])
 @login_required
 def get_locations():
+    return run_read(read_locations)
+
+@app.route('/api/locations', methods=['POST'])
+@login_required
+def create_location():
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return jsonify({'error': 'Location name is required'}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM locations")
-    locations = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return jsonify(locations)
+    try:
+        cursor.execute("""
+            INSERT INTO locations (lab_id, name, room_number, description)
+            VALUES (%s, %s, %s, %s)
+            RETURNING *
+        """, (current_lab_id(), name.strip(), data.get('room_number') or None, data.get('description') or None))
+        location = cursor.fetchone()
+        conn.commit()
+        return jsonify(location), 201
+    finally:
+        cursor.close()
+        conn.close()
+
+# Lets a member replace a leaked join code; the old one stops working immediately
+@app.route('/api/lab/join-code', methods=['POST'])
+@login_required
+def rotate_join_code():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        join_code = new_join_code()
+        cursor.execute("UPDATE labs SET join_code = %s WHERE id = %s", (join_code, current_lab_id()))
+        conn.commit()
+        return jsonify({'join_code': join_code})
+    finally:
+        cursor.close()
+        conn.close()
 
 # --- BOOKINGS API ---
 
@@ -388,19 +897,7 @@ def get_locations():
 @app.route('/api/bookings', methods=['GET'])
 @login_required
 def get_bookings():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT * FROM bookings ORDER BY booking_date DESC")
-    bookings = cursor.fetchall()
-    
-    # Format date for JSON
-    for b in bookings:
-        if b['booking_date']:
-            b['booking_date'] = b['booking_date'].isoformat()
-            
-    cursor.close()
-    conn.close()
-    return jsonify(bookings)
+    return run_read(read_bookings)
 
 # 2. Add New Booking
 @app.route('/api/bookings', methods=['POST'])
@@ -412,17 +909,16 @@ def save_booking():
     
     try:
         query = """
-            INSERT INTO bookings (type, resource_name, researcher_name, booking_date)
-            VALUES (%s, %s, %s, %s) RETURNING id
+            INSERT INTO bookings (lab_id, type, resource_name, researcher_name, booking_date)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
         """
-        vals = (data['type'], data['resourceName'], data['researcherName'], data['date'])
+        vals = (current_lab_id(), data['type'], data['resourceName'], data['researcherName'], data['date'])
         cursor.execute(query, vals)
         new_id = cursor.fetchone()[0] # Get ID from RETURNING
         conn.commit()
         return jsonify({'message': 'Success', 'id': new_id}), 201
     except Exception as e:
-        print(f"ERROR SAVING BOOKING: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("ERROR SAVING BOOKING", e)
     finally:
         cursor.close()
         conn.close()
@@ -433,7 +929,7 @@ def save_booking():
 def delete_booking_api(id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM bookings WHERE id = %s", (id,))
+    cursor.execute("DELETE FROM bookings WHERE id = %s AND lab_id = %s", (id, current_lab_id()))
     conn.commit()
     cursor.close()
     conn.close()
@@ -445,22 +941,10 @@ def delete_booking_api(id):
 @app.route('/api/orders', methods=['GET'])
 @login_required
 def get_orders():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cursor.execute("SELECT * FROM purchase_orders ORDER BY order_date DESC")
-        orders = cursor.fetchall()
-        # Format date
-        for o in orders:
-            if o['order_date']:
-                o['order_date'] = o['order_date'].isoformat()
-        return jsonify(orders)
+        return run_read(read_orders)
     except Exception as e:
-        print(f"Error fetching orders: {e}")
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+        return unexpected_error("Error fetching orders", e)
 
 # 2. Create Order
 @app.route('/api/orders', methods=['POST'])
@@ -475,11 +959,12 @@ def create_order():
             return jsonify({'error': 'Missing required fields'}), 400
 
         query = """
-            INSERT INTO purchase_orders (po_number, supplier, order_date, items, total_cost, status)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO purchase_orders (lab_id, po_number, supplier, order_date, items, total_cost, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """
         vals = (
+            current_lab_id(),
             data['po_number'],
             data['supplier'],
             data.get('order_date') or None, # Default to today if None handled by DB? No, DB says NOT NULL. Frontend should send it.
@@ -492,8 +977,7 @@ def create_order():
         conn.commit()
         return jsonify({'message': 'Order created', 'id': new_id}), 201
     except Exception as e:
-        print(f"Error creating order: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("Error creating order", e)
     finally:
         cursor.close()
         conn.close()
@@ -532,14 +1016,13 @@ def update_order(id):
         if not fields:
             return jsonify({'error': 'No fields to update'}), 400
             
-        vals.append(id)
-        query = f"UPDATE purchase_orders SET {', '.join(fields)} WHERE id = %s"
+        vals.extend([id, current_lab_id()])
+        query = f"UPDATE purchase_orders SET {', '.join(fields)} WHERE id = %s AND lab_id = %s"
         cursor.execute(query, tuple(vals))
         conn.commit()
         return jsonify({'message': 'Order updated successfully'})
     except Exception as e:
-        print(f"Update Error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("Update Error", e)
     finally:
         cursor.close()
         conn.close()
@@ -551,23 +1034,138 @@ def delete_order(id):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM purchase_orders WHERE id = %s", (id,))
+        cursor.execute("DELETE FROM purchase_orders WHERE id = %s AND lab_id = %s", (id, current_lab_id()))
         conn.commit()
         return jsonify({'message': 'Deleted successfully'})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("Error deleting order", e)
     finally:
         cursor.close()
         conn.close()
 
+# --- BATCH API ---
+# Lets a page fetch several read-only resources in one round trip:
+#   POST /api/batch {"requests": [{"id": "locs", "path": "/api/locations"},
+#                                 {"path": "/api/equipments/3"}]}
+# All sub-requests share one connection and one REPEATABLE READ snapshot.
+
+MAX_BATCH_SIZE = 20
+
+BATCH_READERS = {
+    'get_chemicals': read_chemicals,
+    'get_chemical': read_chemical,
+    'get_equipments': read_equipments,
+    'get_equipment_by_id': read_equipment,
+    'get_locations': read_locations,
+    'get_bookings': read_bookings,
+    'get_orders': read_orders,
+}
+
+def resolve_batch_path(path):
+    """Maps a sub-request path to (reader, view_args, query args) or raises HTTPException"""
+    parts = urlsplit(path)
+    adapter = app.url_map.bind('localhost')
+    try:
+        endpoint, view_args = adapter.match(parts.path, method='GET')
+    except RequestRedirect:
+        raise BadRequest(f"{parts.path or '(empty path)'} cannot be batched")
+    reader = BATCH_READERS.get(endpoint)
+    if reader is None:
+        raise BadRequest(f"{parts.path} cannot be batched")
+    return reader, view_args, MultiDict(parse_qsl(parts.query))
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    sub_requests = data.get('requests')
+
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'error': 'No requests provided'}), 400
+    if len(sub_requests) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many requests (max {MAX_BATCH_SIZE})'}), 400
+    for i, sub in enumerate(sub_requests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            return jsonify({'error': f'Request {i} must be an object with a string path'}), 400
+
+    conn = get_db_connection()
+    conn.set_session(isolation_level=ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    responses = []
+    try:
+        for i, sub in enumerate(sub_requests):
+            result = {'id': sub.get('id', i)}
+            try:
+                reader, view_args, args = resolve_batch_path(sub['path'])
+            except HTTPException as e:
+                result.update(status=e.code, body={'error': e.description})
+                responses.append(result)
+                continue
+
+            # A savepoint keeps one failing query from aborting the shared snapshot
+            cursor.execute("SAVEPOINT batch_item")
+            try:
+                body, status = reader(cursor, args, **view_args)
+                cursor.execute("RELEASE SAVEPOINT batch_item")
+            except psycopg2.errors.QueryCanceled:
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_item")
+                body, status = {'error': 'The request took too long and was cancelled.'}, 504
+            except Exception as e:
+                print(f"Batch Error ({sub.get('path')}): {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_item")
+                body, status = {'error': str(e)}, 500
+            result.update(status=status, body=body)
+            responses.append(result)
+
+        conn.commit()
+        return jsonify({'responses': responses})
+    finally:
+        cursor.close()
+        conn.close()
+
+# --- ADMIN API ---
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@login_required
+@admin_required
+def get_slow_queries():
+    """Most recent slow queries recorded by any worker (newest first)"""
+    limit = request.args.get('limit', type=int)
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        queries = query_sampler.recent(cursor, limit)
+    finally:
+        cursor.close()
+        conn.close()
+    return jsonify({
+        'threshold_ms': query_sampler.SLOW_QUERY_MS,
+        'explain_sample_rate': query_sampler.EXPLAIN_SAMPLE_RATE,
+        'queries': queries
+    })
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@login_required
+@admin_required
+def clear_slow_queries():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        query_sampler.clear(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return jsonify({'message': 'Cleared'})
+
 # --- AI LOOKUP API ---
 
 @app.route('/api/ai-lookup', methods=['POST'])
 @login_required
-def ai_lookup():
-    if not GEMINI_API_KEY:
-        return jsonify({'error': 'Gemini API Key not configured. Please set GEMINI_API_KEY env var.'}), 503
-    
+@ai_endpoint
+def ai_lookup(provider):
     data = request.json
     query = data.get('query')
     
@@ -575,7 +1173,6 @@ def ai_lookup():
         return jsonify({'error': 'No query provided'}), 400
 
     try:
-        model = genai.GenerativeModel('gemini-flash-latest')
         prompt = f"""
         You are a lab assistant. Provide technical details for the chemical '{query}'.
         Return ONLY valid JSON with no markdown formatting.
@@ -588,8 +1185,7 @@ def ai_lookup():
         Example: {{"cas_number": "67-64-1", "safety_notes": "Highly flammable. Causes eye irritation.", "recommended_storage": "Flammables Cabinet", "expiry_months": 60}}
         """
         
-        response = model.generate_content(prompt)
-        text = response.text.strip()
+        text = ai_provider.call(provider, prompt, timeout=ENDPOINT_AI_TIMEOUTS['ai_lookup']).strip()
         
         # Clean up code blocks if present
         if text.startswith('```json'):
@@ -601,18 +1197,15 @@ def ai_lookup():
         return jsonify(result)
         
     except Exception as e:
-        print(f"AI Error: {e}")
-        return jsonify({'error': f"AI processing failed: {str(e)}"}), 500
+        return unexpected_error("AI Error", e, f"AI processing failed: {e}")
 
 @app.route('/api/check-hazards', methods=['GET'])
 @login_required
-def check_hazards():
+@ai_endpoint
+def check_hazards(provider):
     """
     Analyzes inventory for dangerous combinations within the same storage location.
     """
-    if not GEMINI_API_KEY:
-        return jsonify({'error': 'Gemini API Key not configured.'}), 503
-
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -622,9 +1215,10 @@ def check_hazards():
             SELECT c.name as chemical, l.name as location 
             FROM chemicals c
             JOIN locations l ON c.location_id = l.id
+            WHERE c.lab_id = %s
             ORDER BY l.name
         """
-        cursor.execute(query)
+        cursor.execute(query, (current_lab_id(),))
         rows = cursor.fetchall()
         cursor.close()
         conn.close()
@@ -647,7 +1241,6 @@ def check_hazards():
         # 4. Construct Prompt
         inventory_str = json.dumps(locations_to_check, indent=2)
         
-        model = genai.GenerativeModel('gemini-flash-latest')
         prompt = f"""
         You are a Chemical Safety Officer. Analyze this inventory for dangerous incompatible storage.
         The input is a JSON object where keys are "Location Names" and values are lists of chemicals stored there.
@@ -672,8 +1265,7 @@ def check_hazards():
         }}
         """
 
-        response = model.generate_content(prompt)
-        text = response.text.strip()
+        text = ai_provider.call(provider, prompt, timeout=ENDPOINT_AI_TIMEOUTS['check_hazards']).strip()
         
         # Clean up code blocks
         if text.startswith('```json'):
@@ -686,22 +1278,15 @@ def check_hazards():
         return jsonify(result)
 
     except Exception as e:
-        print(f"Hazard Scan Error: {e}")
-        return jsonify({'error': str(e)}), 500
-
-    except Exception as e:
-        print(f"Hazard Scan Error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("Hazard Scan Error", e)
 
 @app.route('/api/ai-search', methods=['POST'])
 @login_required
-def ai_search():
+@ai_endpoint
+def ai_search(provider):
     """
     Semantic search: Sends user query + inventory summary to Gemini to find matches.
     """
-    if not GEMINI_API_KEY:
-        return jsonify({'error': 'Gemini API Key not configured.'}), 503
-
     data = request.json
     user_query = data.get('query')
     if not user_query:
@@ -711,7 +1296,8 @@ def ai_search():
         # 1. Fetch all chemicals (ID, Name, CAS, Description/Safety)
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT id, name, cas_number, safety_notes FROM chemicals")
+        cursor.execute("SELECT id, name, cas_number, safety_notes FROM chemicals WHERE lab_id = %s",
+                       (current_lab_id(),))
         inventory = cursor.fetchall()
         cursor.close()
         conn.close()
@@ -727,7 +1313,6 @@ def ai_search():
         inventory_context = "\n".join(inventory_list)
 
         # 3. Prompt Gemini
-        model = genai.GenerativeModel('gemini-flash-latest')
         prompt = f"""
         You are an intelligent lab inventory assistant.
         User Query: "{user_query}"
@@ -749,8 +1334,7 @@ def ai_search():
         }}
         """
 
-        response = model.generate_content(prompt)
-        text = response.text.strip()
+        text = ai_provider.call(provider, prompt, timeout=ENDPOINT_AI_TIMEOUTS['ai_search']).strip()
         
         # Clean up
         if text.startswith('```json'): code_block = text[7:-3]
@@ -761,8 +1345,18 @@ def ai_search():
         return jsonify(result)
 
     except Exception as e:
-        print(f"AI Search Error: {e}")
-        return jsonify({'error': str(e)}), 500
+        return unexpected_error("AI Search Error", e)
+
+# --- APP FACTORY ---
+
+def create_app(preload=False):
+    """
+    Entry point for gunicorn. With preload=True (used with `gunicorn --preload`)
+    the AI SDK is imported once in the parent so every forked worker starts warm.
+    """
+    if preload:
+        ai_provider.warm()
+    return app
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -0,0 +1,118 @@
+"""
+Archival job: moves dead rows out of the hot tables into their *_archive twins
+(see schema_postgres.sql) so list queries, dashboard scans and AI prompts only
+see live data. Archived rows are still readable through the API with
+?include_archived=1.
+
+What gets archived:
+- chemicals expired for more than ARCHIVE_EXPIRED_DAYS days
+- equipment with status 'Retired'
+- bookings older than ARCHIVE_BOOKING_DAYS days
+- purchase orders that are Received or Cancelled and older than ARCHIVE_ORDER_DAYS days
+
+Rows are moved in batches (one DELETE ... RETURNING -> INSERT per batch, one
+commit per batch), so the job can be stopped and re-run at any point.
+
+Usage:
+    python archive.py [--batch-size 500] [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+import psycopg2
+
+from app import get_db_connection
+
+ARCHIVE_RULES = [
+    ('chemicals', "expiry_date < CURRENT_DATE - %(expired_days)s"),
+    ('equipments', "status = 'Retired'"),
+    ('bookings', "booking_date < CURRENT_DATE - %(booking_days)s"),
+    ('purchase_orders', "status IN ('Received', 'Cancelled') AND order_date < CURRENT_DATE - %(order_days)s"),
+]
+
+# Moving large batches can legitimately take longer than a web request's budget
+ARCHIVE_STATEMENT_TIMEOUT_MS = 60000
+
+
+def get_columns(cursor, table):
+    cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+    return ', '.join(col[0] for col in cursor.description)
+
+
+def count_candidates(conn, table, condition, params):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}", params)
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def archive_table(conn, table, condition, params, batch_size):
+    """Moves matching rows batch by batch. Returns the number of rows moved."""
+    cursor = conn.cursor()
+    columns = get_columns(cursor, table)
+    query = f"""
+        WITH moved AS (
+            DELETE FROM {table}
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE {condition}
+                ORDER BY id
+                LIMIT %(batch_size)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {columns}
+        )
+        INSERT INTO {table}_archive ({columns})
+        SELECT {columns} FROM moved
+    """
+    total = 0
+    try:
+        while True:
+            cursor.execute(query, dict(params, batch_size=batch_size))
+            moved = cursor.rowcount
+            conn.commit()
+            total += moved
+            if moved < batch_size:
+                break
+    finally:
+        cursor.close()
+    return total
+
+
+def run(batch_size=500, dry_run=False):
+    params = {
+        'expired_days': int(os.getenv('ARCHIVE_EXPIRED_DAYS', 30)),
+        'booking_days': int(os.getenv('ARCHIVE_BOOKING_DAYS', 90)),
+        'order_days': int(os.getenv('ARCHIVE_ORDER_DAYS', 180)),
+    }
+    conn = get_db_connection(statement_timeout_ms=ARCHIVE_STATEMENT_TIMEOUT_MS)
+    results = {}
+    try:
+        for table, condition in ARCHIVE_RULES:
+            # One table failing (e.g. a statement timeout) shouldn't stop the others
+            try:
+                if dry_run:
+                    results[table] = count_candidates(conn, table, condition, params)
+                else:
+                    results[table] = archive_table(conn, table, condition, params, batch_size)
+            except psycopg2.Error as e:
+                conn.rollback()
+                results[table] = None
+                print(f"{table}: archiving failed: {e}")
+                continue
+            print(f"{table}: {results[table]} row(s) {'would be ' if dry_run else ''}archived")
+    finally:
+        conn.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move expired/retired/old rows into the archive tables.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be archived")
+    args = parser.parse_args()
+    results = run(batch_size=args.batch_size, dry_run=args.dry_run)
+    # Non-zero exit so the cron run shows up as failed
+    sys.exit(1 if None in results.values() else 0)
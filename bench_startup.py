@@ -0,0 +1,89 @@
+"""
+Startup benchmark: measures how long it takes to import the app, serve a
+plain page and serve the first AI request in a fresh process, for three
+setups:
+
+- eager:   google.generativeai imported at module load (the old behaviour)
+- lazy:    SDK imported on the first AI call
+- preload: SDK warmed by create_app(preload=True), as with gunicorn --preload
+
+The child gets a dummy GEMINI_API_KEY so the SDK really loads, and the model
+call itself is stubbed out so no network time is included.
+
+Usage:
+    python bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs inside a fresh interpreter so module caches don't skew the numbers.
+CHILD_SCRIPT = """
+import json, os, sys, time
+os.environ['GEMINI_API_KEY'] = os.environ.get('GEMINI_API_KEY') or 'bench-dummy-key'
+t0 = time.perf_counter()
+if %(mode)r == 'eager':
+    import google.generativeai
+import app as app_module
+import ai_provider
+t1 = time.perf_counter()
+flask_app = app_module.create_app(preload=%(mode)r == 'preload')
+t2 = time.perf_counter()
+sdk_after_startup = 'google.generativeai' in sys.modules
+
+def stub_generate(self, prompt):
+    self._get_model()  # loads the SDK and builds the model, skips the network call
+    return '{"cas_number": "67-64-1", "safety_notes": "stub", "recommended_storage": "General", "expiry_months": 24}'
+ai_provider.GeminiProvider.generate = stub_generate
+
+client = flask_app.test_client()
+with client.session_transaction() as s:
+    s['user_id'] = 1
+    s['username'] = 'bench'
+    s['lab_id'] = 1
+client.get('/')
+t3 = time.perf_counter()
+response = client.post('/api/ai-lookup', json={'query': 'acetone'})
+t4 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'factory_ms': (t2 - t1) * 1000,
+    'first_page_ms': (t3 - t2) * 1000,
+    'first_ai_request_ms': (t4 - t3) * 1000,
+    'ai_status': response.status_code,
+    'sdk_after_startup': sdk_after_startup,
+}))
+"""
+
+
+def run_once(mode):
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT % {'mode': mode}],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def report(label, samples):
+    print(f"\n{label}")
+    for key in ('import_ms', 'factory_ms', 'first_page_ms', 'first_ai_request_ms'):
+        values = [s[key] for s in samples]
+        print(f"  {key:<20} median {statistics.median(values):8.1f}   max {max(values):8.1f}")
+    print(f"  {'sdk_after_startup':<20} {samples[0]['sdk_after_startup']}")
+    print(f"  {'ai_status':<20} {samples[0]['ai_status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    report("Eager (SDK imported at module load)", [run_once('eager') for _ in range(args.runs)])
+    report("Lazy (SDK imported on first AI call)", [run_once('lazy') for _ in range(args.runs)])
+    report("Preloaded (create_app(preload=True))", [run_once('preload') for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+Enrichment job: fills in missing CAS numbers and safety notes for chemicals
+that were entered without them, instead of one /api/ai-lookup call per row.
+
+Incomplete chemicals are read in id order, a page at a time. Each page is
+split into multi-chemical prompts of bounded size, which are sent through
+ai_provider.call() with a rate limit and retries. Responses are validated
+(known ids only, CAS format and check digit, short notes) and the page is
+written back with a single UPDATE. The last id of each page is committed
+together with its results in enrichment_progress, so an interrupted run picks
+up where it stopped. Only empty fields are filled; values typed in by users
+are never overwritten.
+
+A prompt that still fails after its retries because of what the model did with
+it (broken JSON, a blocked or empty answer, any other error raised while
+generating) doesn't block the job: its ids are recorded in enrichment_failures
+and the checkpoint moves past them. They can be retried later with
+--retry-failed. If the AI service itself is unreachable (timeouts, network or
+5xx errors, circuit breaker open), the run stops without checkpointing so the
+next run redoes the page.
+
+Usage:
+    python enrich.py [--batch-size 10] [--limit N] [--lab-id N] [--restart] [--retry-failed] [--dry-run] [--fake]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+from psycopg2.extras import RealDictCursor, execute_values
+
+import ai_provider
+from app import get_db_connection
+
+BATCH_SIZE = int(os.getenv('ENRICH_BATCH_SIZE', 10))           # chemicals per prompt
+MAX_PROMPT_CHARS = int(os.getenv('ENRICH_MAX_PROMPT_CHARS', 6000))
+RATE_PER_MINUTE = float(os.getenv('ENRICH_RATE_PER_MINUTE', 30))
+MAX_RETRIES = int(os.getenv('ENRICH_MAX_RETRIES', 3))
+AI_TIMEOUT_SECONDS = float(os.getenv('ENRICH_AI_TIMEOUT_SECONDS', 60))
+PROMPTS_PER_PAGE = 5
+MAX_NOTES_CHARS = 300
+
+# Placeholders people type when they don't know the CAS number (the column is NOT NULL)
+MISSING_CAS = "(btrim({t}.cas_number) = '' OR upper(btrim({t}.cas_number)) IN ('N/A', 'NA', 'UNKNOWN', '-', 'TBD'))"
+MISSING_NOTES = "({t}.safety_notes IS NULL OR btrim({t}.safety_notes) = '')"
+
+CAS_PATTERN = re.compile(r'^\d{2,7}-\d{2}-\d$')
+
+
+class EnrichmentError(Exception):
+    pass
+
+
+class PromptFailed(EnrichmentError):
+    """The service answered, but never usefully for this prompt. Skipped, not fatal."""
+
+
+# --- SELECTION ---
+
+def job_name(lab_id):
+    return f"chemicals:lab-{lab_id}" if lab_id else 'chemicals'
+
+
+def load_progress(conn, job):
+    cursor = conn.cursor()
+    cursor.execute("SELECT last_id FROM enrichment_progress WHERE job = %s", (job,))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else 0
+
+
+def save_progress(cursor, job, last_id):
+    cursor.execute("""
+        INSERT INTO enrichment_progress (job, last_id, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = EXCLUDED.updated_at
+    """, (job, last_id))
+
+
+def candidates_query(lab_id, only_failed=False):
+    query = f"""
+        SELECT c.id, c.name, c.formula,
+               {MISSING_CAS.format(t='c')} AS needs_cas,
+               {MISSING_NOTES.format(t='c')} AS needs_notes
+        FROM chemicals c
+        WHERE c.id > %(after_id)s
+          AND ({MISSING_CAS.format(t='c')} OR {MISSING_NOTES.format(t='c')})
+    """
+    if lab_id:
+        query += " AND c.lab_id = %(lab_id)s"
+    if only_failed:
+        query += " AND c.id IN (SELECT chemical_id FROM enrichment_failures WHERE job = %(job)s)"
+    return query + " ORDER BY c.id LIMIT %(limit)s"
+
+
+def fetch_page(conn, after_id, limit, lab_id=None, only_failed=False):
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(candidates_query(lab_id, only_failed),
+                   {'after_id': after_id, 'limit': limit, 'lab_id': lab_id, 'job': job_name(lab_id)})
+    rows = cursor.fetchall()
+    cursor.close()
+    # Don't hold a transaction open while waiting on the model
+    conn.rollback()
+    return rows
+
+
+def count_candidates(conn, after_id, lab_id=None, only_failed=False):
+    cursor = conn.cursor()
+    query = f"SELECT COUNT(*) FROM ({candidates_query(lab_id, only_failed)}) AS pending"
+    cursor.execute(query, {'after_id': after_id, 'limit': None, 'lab_id': lab_id, 'job': job_name(lab_id)})
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+# --- PROMPTS ---
+
+def prompt_item(row):
+    return {'id': row['id'], 'name': row['name'], 'formula': row['formula']}
+
+
+def build_prompt(rows):
+    items = json.dumps([prompt_item(row) for row in rows])
+    return f"""
+        You are a lab assistant. Provide technical details for each chemical listed below.
+        Return ONLY a valid JSON array with no markdown formatting, one object per chemical.
+        Keys:
+        - id (integer, copied from the input)
+        - cas_number (string, null if you are not sure)
+        - safety_notes (short summary of hazards, max 15 words)
+
+        Example: [{{"id": 7, "cas_number": "67-64-1", "safety_notes": "Highly flammable. Causes eye irritation."}}]
+
+        Chemicals:
+        {items}
+        """
+
+
+def chunk_rows(rows, batch_size=BATCH_SIZE, max_chars=MAX_PROMPT_CHARS):
+    """Groups rows into prompts of at most batch_size chemicals and roughly max_chars characters"""
+    chunk, size = [], len(build_prompt([]))
+    for row in rows:
+        item_size = len(json.dumps(prompt_item(row))) + 2
+        if chunk and (len(chunk) >= batch_size or size + item_size > max_chars):
+            yield chunk
+            chunk, size = [], len(build_prompt([]))
+        chunk.append(row)
+        size += item_size
+    if chunk:
+        yield chunk
+
+
+# --- VALIDATION ---
+
+def strip_code_fence(text):
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text[7:-3]
+    elif text.startswith('```'):
+        text = text[3:-3]
+    return text.strip()
+
+
+def valid_cas(value):
+    """Checks the format and the CAS check digit (weighted sum of the other digits, mod 10)"""
+    if not CAS_PATTERN.match(value):
+        return False
+    digits = value.replace('-', '')
+    body, check = digits[:-1], int(digits[-1])
+    total = sum(int(d) * weight for weight, d in enumerate(reversed(body), start=1))
+    return total % 10 == check
+
+
+def parse_response(text, rows):
+    """
+    Returns ({id: (cas_number, safety_notes)}, rejected_count) for the rows that
+    need them. Raises ValueError if the reply isn't a JSON array at all.
+    """
+    data = json.loads(strip_code_fence(text))
+    if isinstance(data, dict):
+        data = data.get('results') or data.get('chemicals')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array')
+
+    by_id = {row['id']: row for row in rows}
+    results, rejected = {}, 0
+    for item in data:
+        try:
+            row = by_id.get(int(item.get('id')))
+        except (AttributeError, TypeError, ValueError):
+            row = None
+        if row is None:
+            rejected += 1
+            continue
+
+        cas = item.get('cas_number')
+        cas = cas.strip() if isinstance(cas, str) else None
+        if not (row['needs_cas'] and cas and valid_cas(cas)):
+            cas = None
+
+        notes = item.get('safety_notes')
+        notes = ' '.join(notes.split()) if isinstance(notes, str) else None
+        if not (row['needs_notes'] and notes):
+            notes = None
+        elif len(notes) > MAX_NOTES_CHARS:
+            notes = notes[:MAX_NOTES_CHARS].rsplit(' ', 1)[0]
+
+        if cas is None and notes is None:
+            rejected += 1
+            continue
+        results[row['id']] = (cas, notes)
+    return results, rejected
+
+
+# --- CALLING THE MODEL ---
+
+class RateLimiter:
+    """Spaces calls at least 60 / rate_per_minute seconds apart"""
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def is_outage(provider, exc):
+    """Timeouts, an open breaker and transport/5xx errors; anything else is the prompt's fault"""
+    return isinstance(exc, ai_provider.AIUnavailable) or provider.is_upstream_failure(exc)
+
+
+def enrich_chunk(provider, rows, limiter, retries=MAX_RETRIES):
+    """
+    Calls the model for one prompt, retrying failures and unusable replies with
+    backoff. Raises PromptFailed if the last attempt got an answer but not a
+    usable one, and EnrichmentError if the service was unreachable.
+    """
+    prompt = build_prompt(rows)
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            text = ai_provider.call(provider, prompt, timeout=AI_TIMEOUT_SECONDS)
+            return parse_response(text, rows)
+        except ai_provider.CircuitOpenError as e:
+            error, delay = e, ai_provider.breaker.retry_after()
+        except Exception as e:
+            error, delay = e, min(60, 2 ** attempt) + random.uniform(0, 1)
+        if attempt < retries:
+            print(f"Enrichment attempt {attempt + 1} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    message = f"Giving up on chemicals {rows[0]['id']}-{rows[-1]['id']}: {error}"
+    if is_outage(provider, error):
+        raise EnrichmentError(message)
+    raise PromptFailed(message)
+
+
+# --- WRITE-BACK ---
+
+def write_results(cursor, results):
+    """Bulk update; re-checks emptiness so edits made during the run win"""
+    if not results:
+        return 0
+    # One statement for the whole page, so rowcount covers every row
+    execute_values(cursor, f"""
+        UPDATE chemicals AS c SET
+            cas_number = CASE WHEN v.cas_number IS NOT NULL AND {MISSING_CAS.format(t='c')}
+                              THEN v.cas_number ELSE c.cas_number END,
+            safety_notes = CASE WHEN v.safety_notes IS NOT NULL AND {MISSING_NOTES.format(t='c')}
+                                THEN v.safety_notes ELSE c.safety_notes END,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(id, cas_number, safety_notes)
+        WHERE c.id = v.id
+    """, [(id, cas, notes) for id, (cas, notes) in results.items()],
+        template='(%s::int, %s::varchar, %s::text)', page_size=len(results))
+    return cursor.rowcount
+
+
+def save_failures(cursor, job, failed, succeeded_ids):
+    """Records ids whose prompt kept failing and clears ids that have now been answered"""
+    if succeeded_ids:
+        cursor.execute("DELETE FROM enrichment_failures WHERE job = %s AND chemical_id = ANY(%s)",
+                       (job, list(succeeded_ids)))
+    if failed:
+        execute_values(cursor, """
+            INSERT INTO enrichment_failures (job, chemical_id, error) VALUES %s
+            ON CONFLICT (job, chemical_id) DO UPDATE
+            SET error = EXCLUDED.error, failed_at = CURRENT_TIMESTAMP
+        """, [(job, chem_id, error) for chem_id, error in failed.items()])
+
+
+# --- OFFLINE BACKEND ---
+
+FAKE_DATA = {
+    'acetone': ('67-64-1', 'Highly flammable. Causes serious eye irritation.'),
+    'ethanol': ('64-17-5', 'Highly flammable liquid and vapour.'),
+    'methanol': ('67-56-1', 'Flammable. Toxic if swallowed, inhaled or absorbed.'),
+    'sodium chloride': ('7647-14-5', 'Low hazard. Avoid eye contact.'),
+    'hydrochloric acid': ('7647-01-0', 'Corrosive. Causes severe burns; irritating vapour.'),
+    'sulfuric acid': ('7664-93-9', 'Corrosive. Reacts violently with water.'),
+    'water': ('7732-18-5', 'No significant hazards.'),
+}
+
+
+def fake_response(prompt):
+    """Deterministic replies for --fake: known names get real data, the rest get generic notes"""
+    items = json.loads(prompt.split('Chemicals:', 1)[1])
+    replies = []
+    for item in items:
+        cas, notes = FAKE_DATA.get(item['name'].strip().lower(), (None, 'Handle with standard lab precautions.'))
+        replies.append({'id': item['id'], 'cas_number': cas, 'safety_notes': notes})
+    return json.dumps(replies)
+
+
+# --- DRIVER ---
+
+def run(batch_size=BATCH_SIZE, limit=None, lab_id=None, restart=False, dry_run=False,
+        provider=None, rate_per_minute=RATE_PER_MINUTE, retries=MAX_RETRIES, retry_failed=False):
+    """
+    With retry_failed=True only ids in enrichment_failures are processed, and
+    the main checkpoint is left alone.
+    """
+    job = job_name(lab_id)
+    conn = get_db_connection(statement_timeout_ms=60000)
+    stats = {'processed': 0, 'updated': 0, 'rejected': 0, 'failed': 0}
+    try:
+        after_id = 0 if restart or retry_failed else load_progress(conn, job)
+        if dry_run:
+            stats['pending'] = count_candidates(conn, after_id, lab_id, retry_failed)
+            print(f"{stats['pending']} chemical(s) to enrich after id {after_id}")
+            return stats
+
+        provider = provider or ai_provider.get_provider()
+        if provider is None:
+            raise EnrichmentError('No AI provider configured (set GEMINI_API_KEY or use --fake)')
+        limiter = RateLimiter(rate_per_minute)
+
+        while limit is None or stats['processed'] < limit:
+            page_size = batch_size * PROMPTS_PER_PAGE
+            if limit is not None:
+                page_size = min(page_size, limit - stats['processed'])
+            rows = fetch_page(conn, after_id, page_size, lab_id, retry_failed)
+            if not rows:
+                break
+
+            results, failed, succeeded_ids = {}, {}, set()
+            for chunk in chunk_rows(rows, batch_size):
+                try:
+                    chunk_results, rejected = enrich_chunk(provider, chunk, limiter, retries)
+                except PromptFailed as e:
+                    # Outages (plain EnrichmentError) propagate: no checkpoint, the page is redone next run
+                    print(e)
+                    failed.update((row['id'], str(e)) for row in chunk)
+                    continue
+                results.update(chunk_results)
+                succeeded_ids.update(row['id'] for row in chunk)
+                stats['rejected'] += rejected
+
+            # Results, failures and the checkpoint commit together
+            cursor = conn.cursor()
+            try:
+                stats['updated'] += write_results(cursor, results)
+                save_failures(cursor, job, failed, succeeded_ids)
+                after_id = rows[-1]['id']
+                if not retry_failed:
+                    save_progress(cursor, job, after_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            stats['processed'] += len(rows)
+            stats['failed'] += len(failed)
+            print(f"Enriched up to id {after_id}: {stats['updated']} updated, "
+                  f"{stats['rejected']} rejected, {stats['failed']} failed")
+    finally:
+        conn.close()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fill in missing CAS numbers and safety notes with the AI model.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Chemicals per prompt")
+    parser.add_argument('--limit', type=int, help="Stop after this many chemicals")
+    parser.add_argument('--lab-id', type=int, help="Only enrich one lab's chemicals")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved progress and start from the first id")
+    parser.add_argument('--retry-failed', action='store_true', help="Only retry chemicals whose prompts failed before")
+    parser.add_argument('--dry-run', action='store_true', help="Only count the chemicals that would be enriched")
+    parser.add_argument('--fake', action='store_true', help="Use the offline fake model instead of Gemini")
+    args = parser.parse_args()
+
+    run(batch_size=args.batch_size, limit=args.limit, lab_id=args.lab_id, restart=args.restart,
+        dry_run=args.dry_run, retry_failed=args.retry_failed,
+        provider=ai_provider.FakeProvider(fake_response) if args.fake else None)
@@ -0,0 +1,259 @@
+"""
+Slow-query sampler.
+
+get_db_connection() builds connections with SampledConnection, so every cursor
+(plain or RealDictCursor) times its execute() calls. Queries slower than
+SLOW_QUERY_MS are recorded with the shape of their parameters, the call site
+and the endpoint. Statements psycopg2 builds itself (execute_values) arrive with
+their values already inlined; their string and number literals are replaced
+with ? before the text is stored, and they are never explained.
+
+The request thread only queues the record. A background writer thread (one per
+worker process, on its own connection) stores it in the slow_queries table, so
+every worker's records end up in one place. For a sample of the slow plain
+SELECTs it also captures EXPLAIN (ANALYZE, BUFFERS). That re-runs the query, but
+on the writer's connection, inside a READ ONLY transaction that is rolled back,
+under its own SLOW_QUERY_EXPLAIN_TIMEOUT_MS, so the user's request never waits
+on it. /api/admin/slow-queries and `python query_sampler.py` read the table.
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import Json, RealDictCursor
+from flask import has_request_context, request
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))  # 0 disables sampling
+EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+EXPLAIN_TIMEOUT_MS = int(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000))
+KEEP_ROWS = int(os.getenv('SLOW_QUERY_KEEP', 1000))
+QUEUE_SIZE = 200
+MAX_QUERY_CHARS = 2000
+
+# Frames from this module and from psycopg2 (e.g. extras.execute_values) are never the call site
+_SKIP_PATHS = (os.path.abspath(__file__), os.path.dirname(os.path.abspath(psycopg2.__file__)) + os.sep)
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_connect = None
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+# Set on the writer thread so its own queries aren't sampled
+_local = threading.local()
+
+
+def configure(connect):
+    """Sets the zero-argument function the writer thread uses to open its connection"""
+    global _connect
+    _connect = connect
+
+
+def params_shape(params):
+    """Describes query params by type only, so values never end up in the table"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def redact_literals(query):
+    """Replaces inlined string and number literals with ?"""
+    return LITERAL.sub('?', query)
+
+
+def call_site():
+    """Innermost frame outside this module and psycopg2, e.g. 'app.py:312 in read_chemicals'"""
+    for frame in reversed(traceback.extract_stack()):
+        if not os.path.abspath(frame.filename).startswith(_SKIP_PATHS):
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+LOCKING_CLAUSE = re.compile(r'\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE)\b', re.IGNORECASE)
+
+
+def is_explainable(query):
+    # EXPLAIN ANALYZE executes the statement, so only plain, non-locking SELECTs
+    return query.lstrip().upper().startswith('SELECT') and not LOCKING_CLAUSE.search(query)
+
+
+def capture_plan(cursor, query, params):
+    """Runs EXPLAIN (ANALYZE, BUFFERS) in a read-only transaction that is always rolled back"""
+    try:
+        cursor.execute("BEGIN READ ONLY")
+        cursor.execute("SET LOCAL statement_timeout = %s", (EXPLAIN_TIMEOUT_MS,))
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        cursor.execute("ROLLBACK")
+
+
+def record(query, params, duration_ms):
+    """Queues a slow query for the writer thread. Never blocks the caller."""
+    if _connect is None:
+        return
+    # execute_values() mogrifies the whole statement and executes bytes without params
+    inlined = isinstance(query, bytes) and params is None
+    query = query.decode() if isinstance(query, bytes) else query
+    stored_query = redact_literals(query) if inlined else query
+    entry = {
+        'recorded_at': datetime.now(timezone.utc),
+        'duration_ms': round(duration_ms, 1),
+        'query': ' '.join(stored_query.split())[:MAX_QUERY_CHARS],
+        'params_shape': params_shape(params),
+        'call_site': call_site(),
+        'endpoint': request.endpoint if has_request_context() else None,
+    }
+    # The full query and params are only kept in memory, for EXPLAIN
+    explain = (query, params) if not inlined and is_explainable(query) and random.random() < EXPLAIN_SAMPLE_RATE else None
+
+    ensure_writer()
+    try:
+        _queue.put_nowait((entry, explain))
+    except queue.Full:
+        print("Slow query sampler queue full, dropping record")
+        return
+    print(f"Slow query ({entry['duration_ms']} ms) at {entry['call_site']}: {entry['query'][:200]}")
+
+
+def store(cursor, entry, explain):
+    entry = dict(entry, explain=capture_plan(cursor, *explain) if explain else None)
+    cursor.execute("""
+        INSERT INTO slow_queries (recorded_at, duration_ms, query, params_shape, call_site, endpoint, explain)
+        VALUES (%(recorded_at)s, %(duration_ms)s, %(query)s, %(params_shape)s, %(call_site)s, %(endpoint)s, %(explain)s)
+    """, dict(entry, params_shape=Json(entry['params_shape'])))
+    cursor.execute("""
+        DELETE FROM slow_queries
+        WHERE id <= (SELECT id FROM slow_queries ORDER BY id DESC OFFSET %s LIMIT 1)
+    """, (KEEP_ROWS,))
+
+
+def _write_loop():
+    _local.disabled = True
+    conn = None
+    while True:
+        entry, explain = _queue.get()
+        try:
+            if conn is None or conn.closed:
+                conn = _connect()
+                conn.autocommit = True
+            cursor = conn.cursor()
+            try:
+                store(cursor, entry, explain)
+            finally:
+                cursor.close()
+        except Exception as e:
+            print(f"Slow query sampler error: {e}")
+            if conn is not None:
+                conn.close()
+            conn = None
+        finally:
+            _queue.task_done()
+
+
+def ensure_writer():
+    """Starts the writer thread once per process (threads don't survive a gunicorn fork)"""
+    global _writer, _writer_pid
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid() or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name='slow-query-writer', daemon=True)
+            _writer.start()
+            _writer_pid = os.getpid()
+
+
+def flush(timeout=5.0):
+    """Waits until queued records are stored. Used by the CLI and scripts."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def recent(cursor, limit=None):
+    """Newest first"""
+    cursor.execute("""
+        SELECT recorded_at, duration_ms, query, params_shape, call_site, endpoint, explain
+        FROM slow_queries
+        ORDER BY id DESC
+        LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
+
+
+def clear(cursor):
+    cursor.execute("DELETE FROM slow_queries")
+
+
+class SampledCursorMixin:
+    def execute(self, query, vars=None):
+        if SLOW_QUERY_MS <= 0 or getattr(_local, 'disabled', False):
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        result = super().execute(query, vars)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= SLOW_QUERY_MS:
+            try:
+                record(query, vars, duration_ms)
+            except Exception as e:
+                print(f"Slow query sampler error: {e}")
+        return result
+
+
+_cursor_classes = {}
+
+
+def sampled_cursor_class(base):
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        cls = type(f"Sampled{base.__name__}", (SampledCursorMixin, base), {})
+        _cursor_classes[base] = cls
+    return cls
+
+
+class SampledConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (of whatever factory the caller asks for) are timed"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = sampled_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show recently recorded slow queries (newest first).")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--plans', action='store_true', help="Include captured EXPLAIN plans")
+    parser.add_argument('--clear', action='store_true', help="Delete all recorded slow queries")
+    args = parser.parse_args()
+
+    from app import get_db_connection
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    if args.clear:
+        clear(cursor)
+        conn.commit()
+        print("Cleared")
+    else:
+        for row in recent(cursor, args.limit):
+            print(f"{row['recorded_at']:%Y-%m-%d %H:%M:%S}  {row['duration_ms']:>8} ms  "
+                  f"{row['endpoint'] or '-'}  {row['call_site']}")
+            print(f"    {row['query'][:300]}")
+            print(f"    params: {json.dumps(row['params_shape'])}")
+            if args.plans and row['explain']:
+                print('\n'.join('    | ' + line for line in row['explain'].splitlines()))
+    cursor.close()
+    conn.close()
@@ -2,24 +2,49 @@
 -- PostgreSQL Schema
 
 -- Drop tables if they exist (Reverse order of dependencies)
+DROP VIEW IF EXISTS purchase_orders_all;
+DROP VIEW IF EXISTS bookings_all;
+DROP VIEW IF EXISTS equipments_all;
+DROP VIEW IF EXISTS chemicals_all;
+DROP TABLE IF EXISTS slow_queries;
+DROP TABLE IF EXISTS enrichment_failures;
+DROP TABLE IF EXISTS enrichment_progress;
+DROP TABLE IF EXISTS purchase_orders_archive;
+DROP TABLE IF EXISTS bookings_archive;
+DROP TABLE IF EXISTS equipments_archive;
+DROP TABLE IF EXISTS chemicals_archive;
 DROP TABLE IF EXISTS purchase_orders;
 DROP TABLE IF EXISTS bookings;
 DROP TABLE IF EXISTS equipments;
 DROP TABLE IF EXISTS chemicals;
 DROP TABLE IF EXISTS locations;
 DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS labs;
+
+-- Table for Labs (tenants). Every user and inventory row belongs to exactly one lab.
+CREATE TABLE labs (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) UNIQUE NOT NULL,
+    -- New users join an existing lab only with this code (shown on the dashboard)
+    join_code VARCHAR(32) UNIQUE NOT NULL DEFAULT substr(md5(random()::text), 1, 12),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO labs (name) VALUES ('Main Lab');
 
 -- Table for Users (Auth)
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(50) UNIQUE NOT NULL,
     password_hash TEXT NOT NULL,
+    lab_id INT NOT NULL REFERENCES labs(id),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Table for storage locations
 CREATE TABLE locations (
     id SERIAL PRIMARY KEY,
+    lab_id INT NOT NULL REFERENCES labs(id),
     name VARCHAR(100) NOT NULL,
     room_number VARCHAR(20),
     description TEXT,
@@ -29,12 +54,13 @@ CREATE TABLE locations (
 -- Table for the chemicals
 CREATE TABLE chemicals (
     id SERIAL PRIMARY KEY,
+    lab_id INT NOT NULL REFERENCES labs(id),
     cas_number VARCHAR(50) NOT NULL,
     name VARCHAR(200) NOT NULL,
     formula VARCHAR(100),
     
     -- Inventory details
-    quantity DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
+    quantity DECIMAL(10, 2) NOT NULL DEFAULT 0.00 CHECK (quantity >= 0),
     unit VARCHAR(10) NOT NULL,
     
     -- Foreign Key to Location
@@ -51,11 +77,11 @@ CREATE TABLE chemicals (
 );
 
 -- Initial Data for locations
-INSERT INTO locations (name, room_number) VALUES 
-('Flammables Cabinet', '101'),
-('Refrigerator A', '102'),
-('General Shelf 3', '101'),
-('Chemical Storage Room', 'Basement');
+INSERT INTO locations (lab_id, name, room_number) VALUES 
+(1, 'Flammables Cabinet', '101'),
+(1, 'Refrigerator A', '102'),
+(1, 'General Shelf 3', '101'),
+(1, 'Chemical Storage Room', 'Basement');
 
 -- Table for the equipment
 DO $$ BEGIN
@@ -66,6 +92,7 @@ END $$;
 
 CREATE TABLE equipments (
     id SERIAL PRIMARY KEY,
+    lab_id INT NOT NULL REFERENCES labs(id),
     name VARCHAR(200) NOT NULL,
     model_number VARCHAR(100),
     serial_number VARCHAR(100),
@@ -91,6 +118,7 @@ END $$;
 
 CREATE TABLE bookings (
     id SERIAL PRIMARY KEY,
+    lab_id INT NOT NULL REFERENCES labs(id),
     type booking_type NOT NULL,
     resource_name VARCHAR(200) NOT NULL,
     researcher_name VARCHAR(200) NOT NULL,
@@ -107,18 +135,107 @@ END $$;
 
 CREATE TABLE purchase_orders (
     id SERIAL PRIMARY KEY,
-    po_number VARCHAR(50) NOT NULL UNIQUE,
+    lab_id INT NOT NULL REFERENCES labs(id),
+    po_number VARCHAR(50) NOT NULL,
     supplier VARCHAR(100) NOT NULL,
     order_date DATE NOT NULL,
     items TEXT NOT NULL,
     total_cost DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
     status po_status DEFAULT 'Pending',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (lab_id, po_number)
 );
 
 -- Initial Data for Purchase Orders
-INSERT INTO purchase_orders (po_number, supplier, order_date, items, total_cost, status) VALUES 
-('PO-2023-089', 'Motewar Chemicals', '2023-11-15', 'Acetone (5L), Ethanol (2L)', 0.00, 'Received'),
-('PO-2023-090', 'Bobade Acids', '2023-11-20', 'Sulfuric Acid (500ml)', 0.00, 'Shipped'),
-('PO-2023-091', 'Renuka pharma', '2023-11-22', 'Glassware Set', 0.00, 'Pending');
+INSERT INTO purchase_orders (lab_id, po_number, supplier, order_date, items, total_cost, status) VALUES 
+(1, 'PO-2023-089', 'Motewar Chemicals', '2023-11-15', 'Acetone (5L), Ethanol (2L)', 0.00, 'Received'),
+(1, 'PO-2023-090', 'Bobade Acids', '2023-11-20', 'Sulfuric Acid (500ml)', 0.00, 'Shipped'),
+(1, 'PO-2023-091', 'Renuka pharma', '2023-11-22', 'Glassware Set', 0.00, 'Pending');
+
+-- Per-lab indexes: every query is scoped by lab_id, so it leads each index and a
+-- lab's working set stays small no matter how many departments share the database.
+CREATE INDEX idx_locations_lab ON locations (lab_id);
+CREATE INDEX idx_chemicals_lab_created ON chemicals (lab_id, created_at DESC, id DESC);
+CREATE INDEX idx_chemicals_lab_location ON chemicals (lab_id, location_id);
+CREATE INDEX idx_equipments_lab_created ON equipments (lab_id, created_at DESC, id DESC);
+CREATE INDEX idx_bookings_lab_date ON bookings (lab_id, booking_date DESC);
+CREATE INDEX idx_purchase_orders_lab_date ON purchase_orders (lab_id, order_date DESC);
+
+-- Indexes for the archival job's predicates (and the bookings/orders sort order)
+CREATE INDEX idx_chemicals_expiry_date ON chemicals (expiry_date);
+CREATE INDEX idx_bookings_booking_date ON bookings (booking_date);
+CREATE INDEX idx_purchase_orders_status_date ON purchase_orders (status, order_date);
+
+-- Archive tables: archive.py moves expired/retired/old rows here in batches so the
+-- hot tables stay small. Same columns and CHECK constraints as the source table
+-- plus archived_at. Unique indexes are deliberately not copied: a PO number is
+-- free again once its order is archived, and a reused one must still archive.
+CREATE TABLE chemicals_archive (
+    LIKE chemicals INCLUDING CONSTRAINTS,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE equipments_archive (
+    LIKE equipments INCLUDING CONSTRAINTS,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE bookings_archive (
+    LIKE bookings INCLUDING CONSTRAINTS,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE purchase_orders_archive (
+    LIKE purchase_orders INCLUDING CONSTRAINTS,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_chemicals_archive_id ON chemicals_archive (id);
+CREATE INDEX idx_chemicals_archive_lab_created ON chemicals_archive (lab_id, created_at DESC, id DESC);
+CREATE INDEX idx_equipments_archive_id ON equipments_archive (id);
+CREATE INDEX idx_equipments_archive_lab_created ON equipments_archive (lab_id, created_at DESC, id DESC);
+CREATE INDEX idx_bookings_archive_lab_date ON bookings_archive (lab_id, booking_date DESC);
+CREATE INDEX idx_purchase_orders_archive_lab_date ON purchase_orders_archive (lab_id, order_date DESC);
+
+-- Written by query_sampler's background thread; read by /api/admin/slow-queries
+CREATE TABLE slow_queries (
+    id BIGSERIAL PRIMARY KEY,
+    recorded_at TIMESTAMPTZ NOT NULL,
+    duration_ms NUMERIC(10, 1) NOT NULL,
+    query TEXT NOT NULL,
+    params_shape JSONB,
+    call_site TEXT,
+    endpoint VARCHAR(100),
+    explain TEXT
+);
+
+-- Checkpoints for enrich.py: the last chemical id whose results were written back
+CREATE TABLE enrichment_progress (
+    job VARCHAR(50) PRIMARY KEY,
+    last_id INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Chemicals whose enrichment prompt kept failing; enrich.py --retry-failed picks them up
+CREATE TABLE enrichment_failures (
+    job VARCHAR(50) NOT NULL,
+    chemical_id INT NOT NULL,
+    error TEXT,
+    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job, chemical_id)
+);
+
+-- Live + archived rows, only read when the API is called with ?include_archived=1
+CREATE VIEW chemicals_all AS
+    SELECT *, NULL::TIMESTAMP AS archived_at FROM chemicals
+    UNION ALL
+    SELECT * FROM chemicals_archive;
+CREATE VIEW equipments_all AS
+    SELECT *, NULL::TIMESTAMP AS archived_at FROM equipments
+    UNION ALL
+    SELECT * FROM equipments_archive;
+CREATE VIEW bookings_all AS
+    SELECT *, NULL::TIMESTAMP AS archived_at FROM bookings
+    UNION ALL
+    SELECT * FROM bookings_archive;
+CREATE VIEW purchase_orders_all AS
+    SELECT *, NULL::TIMESTAMP AS archived_at FROM purchase_orders
+    UNION ALL
+    SELECT * FROM purchase_orders_archive;
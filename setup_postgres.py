@@ -3,6 +3,14 @@ import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import os
 
+
+def print_seed_join_code(cursor):
+    """The sample data lives in 'Main Lab'; sign up with this code to see it"""
+    cursor.execute("SELECT join_code FROM labs WHERE name = 'Main Lab'")
+    row = cursor.fetchone()
+    if row:
+        print(f"Sample data is in 'Main Lab'. Join it at signup with code: {row[0]}")
+
 # Check if running on Render (DATABASE_URL will be set)
 database_url = os.getenv('DATABASE_URL')
 
@@ -20,9 +28,10 @@ if database_url:
                 cursor.execute(f.read())
                 
             conn.commit()
+            print("Schema executed successfully!")
+            print_seed_join_code(cursor)
             cursor.close()
             conn.close()
-            print("Schema executed successfully!")
             
         except Exception as e:
             print(f"Error executing schema: {e}")
@@ -74,9 +83,10 @@ else:
                 cursor.execute(f.read())
                 
             conn.commit()
+            print("Schema executed successfully!")
+            print_seed_join_code(cursor)
             cursor.close()
             conn.close()
-            print("Schema executed successfully!")
             
         except Exception as e:
             print(f"Error executing schema: {e}")
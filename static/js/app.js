@@ -10,6 +10,20 @@ const API = {
         return await response.json();
     },
 
+    // 1b. Get a slice of chemicals (no limit = everything after the given row)
+    getChemicalsPage: async (after, limit) => {
+        // Continue after a known row rather than an offset, so rows added or
+        // deleted since the page loaded can't shift what comes next
+        const params = new URLSearchParams();
+        if (after && after.created_at) {
+            params.set('before_id', after.id);
+            params.set('before_created_at', after.created_at);
+        }
+        if (limit) params.set('limit', limit);
+        const response = await fetch(`/api/chemicals?${params}`);
+        return await response.json();
+    },
+
     // 2. Get Single Chemical
     getChemicalById: async (id) => {
         const response = await fetch(`/api/chemicals/${id}`);
@@ -36,6 +50,18 @@ const API = {
         return await response.json();
     },
 
+    // 4b. Adjust stock atomically (delta may be negative)
+    adjustQuantity: async (id, delta) => {
+        const response = await fetch(`/api/chemicals/${id}/quantity`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ delta })
+        });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'Failed to adjust stock');
+        return data;
+    },
+
     // 5. Delete Base
     deleteChemical: async (id) => {
         await fetch(`/api/chemicals/${id}`, { method: 'DELETE' });
@@ -72,6 +98,36 @@ const API = {
     },
     deleteOrder: async (id) => {
         await fetch(`/api/orders/${id}`, { method: 'DELETE' });
+    },
+
+    // --- BATCH API ---
+    // Several GETs in one round trip; resolves to the sub-responses in order
+    batch: async (paths) => {
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ requests: paths.map(path => ({ path })) })
+        });
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.error || 'Batch request failed');
+        }
+        return (await response.json()).responses;
+    }
+};
+
+/**
+ * Reads the JSON the server embedded in the page (first page of rows + locations).
+ * Returns null when the page was not server-rendered.
+ */
+const readBootstrap = () => {
+    const el = document.getElementById('bootstrapData');
+    if (!el) return null;
+    try {
+        return JSON.parse(el.textContent);
+    } catch (e) {
+        console.error('Invalid bootstrap data', e);
+        return null;
     }
 };
 
@@ -87,94 +143,106 @@ const InventoryApp = {
         const searchInput = document.getElementById('searchInput');
         const locFilter = document.getElementById('locationFilter');
 
-        // 1. Fetch Real Data (Parallel for speed)
-        const [chemicals, locations] = await Promise.all([
-            API.getAllChemicals(),
-            API.getLocations()
-        ]);
+        // 1. Use server-rendered first page if present, otherwise fetch (Parallel for speed)
+        const boot = readBootstrap();
+        let chemicals, locations;
+        if (boot) {
+            chemicals = boot.chemicals;
+            locations = boot.locations;
+        } else {
+            [chemicals, locations] = await Promise.all([
+                API.getAllChemicals(),
+                API.getLocations()
+            ]);
+        }
+        const hasMore = boot && boot.total > chemicals.length;
 
         // Save to cache & build fast lookup map
         InventoryApp.locationsCache = locations;
         const locMap = {};
         locations.forEach(l => locMap[l.id] = l.name);
 
-        // 2. Update Stats Cards & Notifications
-        const lowStock = chemicals.filter(c => c.quantity < 50);
-        const today = new Date();
-        const expiring = chemicals.filter(c => {
-            if (!c.expiry_date) return false;
-            const expDate = new Date(c.expiry_date);
-            const diffTime = expDate - today;
-            const diffDays = Math.ceil(diffTime / (1000 * 60 * 60 * 24));
-            return diffDays <= 30;
-        });
+        // 2. Update Stats Cards & Notifications (needs the full list)
+        const updateStats = () => {
+            const lowStock = chemicals.filter(c => c.quantity < 50);
+            const today = new Date();
+            const expiring = chemicals.filter(c => {
+                if (!c.expiry_date) return false;
+                const expDate = new Date(c.expiry_date);
+                const diffTime = expDate - today;
+                const diffDays = Math.ceil(diffTime / (1000 * 60 * 60 * 24));
+                return diffDays <= 30;
+            });
 
-        // Update Stats
-        if (document.getElementById('statTotal')) {
-            document.getElementById('statTotal').innerText = chemicals.length;
-            document.getElementById('statLow').innerText = lowStock.length;
-            document.getElementById('statLocs').innerText = locations.length;
-        }
+            // Update Stats
+            if (document.getElementById('statTotal')) {
+                document.getElementById('statTotal').innerText = chemicals.length;
+                document.getElementById('statLow').innerText = lowStock.length;
+                document.getElementById('statLocs').innerText = locations.length;
+            }
 
-        // Update Notifications
-        const notifBadge = document.getElementById('notificationCount');
-        const notifList = document.getElementById('notificationList');
-        const totalAlerts = lowStock.length + expiring.length;
-
-        if (totalAlerts > 0 && notifBadge && notifList) {
-            notifBadge.innerText = totalAlerts;
-            notifBadge.style.display = 'block';
-
-            let html = '';
-
-            // Low Stock Alerts
-            lowStock.forEach(c => {
-                html += `
-                    <div class="p-3 border-bottom d-flex align-items-start bg-warning bg-opacity-10">
-                        <i class="fa-solid fa-triangle-exclamation text-warning mt-1 me-3"></i>
-                        <div>
-                            <p class="mb-0 fw-bold text-dark">Low Stock: ${c.name}</p>
-                            <small class="text-muted">Only ${c.quantity} ${c.unit} remaining.</small>
+            // Update Notifications
+            const notifBadge = document.getElementById('notificationCount');
+            const notifList = document.getElementById('notificationList');
+            const totalAlerts = lowStock.length + expiring.length;
+
+            if (totalAlerts > 0 && notifBadge && notifList) {
+                notifBadge.innerText = totalAlerts;
+                notifBadge.style.display = 'block';
+
+                let html = '';
+
+                // Low Stock Alerts
+                lowStock.forEach(c => {
+                    html += `
+                        <div class="p-3 border-bottom d-flex align-items-start bg-warning bg-opacity-10">
+                            <i class="fa-solid fa-triangle-exclamation text-warning mt-1 me-3"></i>
+                            <div>
+                                <p class="mb-0 fw-bold text-dark">Low Stock: ${c.name}</p>
+                                <small class="text-muted">Only ${c.quantity} ${c.unit} remaining.</small>
+                            </div>
                         </div>
-                    </div>
-                `;
-            });
+                    `;
+                });
 
-            // Expiry Alerts
-            expiring.forEach(c => {
-                const isExpired = new Date(c.expiry_date) < today;
-                const txt = isExpired ? 'Expired' : 'Expiring Soon';
-                const color = isExpired ? 'danger' : 'info';
-                html += `
-                    <div class="p-3 border-bottom d-flex align-items-start bg-${color} bg-opacity-10">
-                        <i class="fa-solid fa-clock text-${color} mt-1 me-3"></i>
-                        <div>
-                            <p class="mb-0 fw-bold text-dark">${txt}: ${c.name}</p>
-                            <small class="text-muted">Date: ${c.expiry_date.split('T')[0]}</small>
+                // Expiry Alerts
+                expiring.forEach(c => {
+                    const isExpired = new Date(c.expiry_date) < today;
+                    const txt = isExpired ? 'Expired' : 'Expiring Soon';
+                    const color = isExpired ? 'danger' : 'info';
+                    html += `
+                        <div class="p-3 border-bottom d-flex align-items-start bg-${color} bg-opacity-10">
+                            <i class="fa-solid fa-clock text-${color} mt-1 me-3"></i>
+                            <div>
+                                <p class="mb-0 fw-bold text-dark">${txt}: ${c.name}</p>
+                                <small class="text-muted">Date: ${c.expiry_date.split('T')[0]}</small>
+                            </div>
                         </div>
+                    `;
+                });
+                notifList.innerHTML = html;
+            } else if (notifList) {
+                notifList.innerHTML = `
+                    <div class="p-4 text-center text-muted small">
+                        <i class="fa-solid fa-check-circle mb-2 text-success fa-2x"></i>
+                        <p class="mb-0">All good! No alerts.</p>
                     </div>
                 `;
+                if (notifBadge) notifBadge.style.display = 'none';
+            }
+        };
+
+        // 3. Populate Filter Dropdown (already server-rendered when bootstrapped)
+        if (!boot) {
+            locFilter.innerHTML = '<option value="">All Locations</option>';
+            locations.forEach(loc => {
+                const opt = document.createElement('option');
+                opt.value = loc.id;
+                opt.textContent = loc.name;
+                locFilter.appendChild(opt);
             });
-            notifList.innerHTML = html;
-        } else if (notifList) {
-            notifList.innerHTML = `
-                <div class="p-4 text-center text-muted small">
-                    <i class="fa-solid fa-check-circle mb-2 text-success fa-2x"></i>
-                    <p class="mb-0">All good! No alerts.</p>
-                </div>
-            `;
-            if (notifBadge) notifBadge.style.display = 'none';
         }
 
-        // 3. Populate Filter Dropdown
-        locFilter.innerHTML = '<option value="">All Locations</option>';
-        locations.forEach(loc => {
-            const opt = document.createElement('option');
-            opt.value = loc.id;
-            opt.textContent = loc.name;
-            locFilter.appendChild(opt);
-        });
-
         // 4. Render "Fancy" Table
         const renderTable = (data) => {
             tableBody.innerHTML = '';
@@ -230,7 +298,30 @@ const InventoryApp = {
             }
         });
         locFilter.addEventListener('change', filterData);
-        renderTable(chemicals);
+
+        // Called after a stock adjustment so the row badge and stats cards stay current
+        InventoryApp.onQuantityChanged = (id, quantity) => {
+            const chem = chemicals.find(c => c.id === id);
+            if (!chem) return;
+            chem.quantity = quantity;
+            updateStats();
+            filterData();
+        };
+
+        // Server already painted the first page; only render here if we fetched it ourselves
+        if (!boot) renderTable(chemicals);
+
+        if (hasMore) {
+            // Pull the remaining rows in the background so filtering and alerts see everything
+            API.getChemicalsPage(chemicals[chemicals.length - 1]).then(rest => {
+                const seen = new Set(chemicals.map(row => row.id));
+                chemicals.push(...rest.filter(row => !seen.has(row.id)));
+                updateStats();
+                if (searchInput.value || locFilter.value) filterData();
+            }).catch(err => console.error('Failed to load remaining chemicals', err));
+        } else {
+            updateStats();
+        }
 
         // --- NEW: AI Search Logic ---
         InventoryApp.aiMode = false;
@@ -404,6 +495,27 @@ const InventoryApp = {
             newEditBtn.onclick = () => InventoryApp.editChem(chem.id);
             newDelBtn.onclick = () => InventoryApp.deleteChem(chem.id);
 
+            // Stock adjustment
+            const adjustInput = document.getElementById('modalAdjustDelta');
+            const adjustBtn = document.getElementById('modalAdjustBtn');
+            adjustInput.value = '';
+            document.getElementById('modalAdjustUnit').textContent = chem.unit;
+            adjustBtn.onclick = async () => {
+                const delta = parseFloat(adjustInput.value);
+                if (isNaN(delta) || delta === 0) return;
+                try {
+                    const result = await API.adjustQuantity(chem.id, delta);
+                    document.getElementById('modalQty').textContent = `${result.quantity} ${result.unit}`;
+                    badgeDiv.innerHTML = result.quantity < 50
+                        ? '<span class="badge bg-warning text-dark px-3 py-2 rounded-pill"><i class="fa-solid fa-triangle-exclamation me-2"></i>Low Stock</span>'
+                        : '<span class="badge bg-success text-white px-3 py-2 rounded-pill"><i class="fa-solid fa-check me-2"></i>In Stock</span>';
+                    if (InventoryApp.onQuantityChanged) InventoryApp.onQuantityChanged(chem.id, result.quantity);
+                    adjustInput.value = '';
+                } catch (err) {
+                    alert(err.message);
+                }
+            };
+
             // Show Modal
             const modalEl = document.getElementById('quickViewModal');
             const modal = new bootstrap.Modal(modalEl);
@@ -426,10 +538,17 @@ const InventoryApp = {
         }
     },
 
-    // --- FORM LOGIC (Unchanged) ---
+    // --- FORM LOGIC ---
     initForm: async () => {
         const locSelect = document.getElementById('location_id');
-        const locations = await API.getLocations();
+        const urlParams = new URLSearchParams(window.location.search);
+        const editId = urlParams.get('id');
+
+        // Locations and the chemical being edited come back in a single request
+        const paths = ['/api/locations'];
+        if (editId) paths.push(`/api/chemicals/${editId}`);
+        const [locRes, chemRes] = await API.batch(paths);
+        const locations = locRes.body;
 
         locations.forEach(loc => {
             const opt = document.createElement('option');
@@ -438,13 +557,10 @@ const InventoryApp = {
             locSelect.appendChild(opt);
         });
 
-        const urlParams = new URLSearchParams(window.location.search);
-        const editId = urlParams.get('id');
-
         if (editId) {
             document.getElementById('pageTitle').textContent = "Edit Chemical";
-            const chem = await API.getChemicalById(editId);
-            if (chem && !chem.error) {
+            const chem = chemRes.body;
+            if (chemRes.status === 200) {
                 document.getElementById('chemId').value = chem.id;
                 document.getElementById('name').value = chem.name;
                 document.getElementById('cas_number').value = chem.cas_number;
@@ -8,6 +8,18 @@ const EQUIP_API = {
         const response = await fetch('/api/equipments');
         return await response.json();
     },
+    getPage: async (after, limit) => {
+        // Continue after a known row rather than an offset, so rows added or
+        // deleted since the page loaded can't shift what comes next
+        const params = new URLSearchParams();
+        if (after && after.created_at) {
+            params.set('before_id', after.id);
+            params.set('before_created_at', after.created_at);
+        }
+        if (limit) params.set('limit', limit);
+        const response = await fetch(`/api/equipments?${params}`);
+        return await response.json();
+    },
     getById: async (id) => {
         const response = await fetch(`/api/equipments/${id}`);
         return await response.json();
@@ -30,6 +42,31 @@ const EQUIP_API = {
     },
     delete: async (id) => {
         await fetch(`/api/equipments/${id}`, { method: 'DELETE' });
+    },
+    // Several GETs in one round trip; resolves to the sub-responses in order
+    batch: async (paths) => {
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ requests: paths.map(path => ({ path })) })
+        });
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.error || 'Batch request failed');
+        }
+        return (await response.json()).responses;
+    }
+};
+
+// Server-embedded first page + locations (null when the page wasn't server-rendered)
+const readBootstrap = () => {
+    const el = document.getElementById('bootstrapData');
+    if (!el) return null;
+    try {
+        return JSON.parse(el.textContent);
+    } catch (e) {
+        console.error('Invalid bootstrap data', e);
+        return null;
     }
 };
 
@@ -41,31 +78,41 @@ const EquipmentApp = {
         const searchInput = document.getElementById('searchInput');
         const locFilter = document.getElementById('locationFilter');
 
-        const [items, locations] = await Promise.all([
-            EQUIP_API.getAll(),
-            EQUIP_API.getLocations()
-        ]);
+        const boot = readBootstrap();
+        let items, locations;
+        if (boot) {
+            items = boot.equipments;
+            locations = boot.locations;
+        } else {
+            [items, locations] = await Promise.all([
+                EQUIP_API.getAll(),
+                EQUIP_API.getLocations()
+            ]);
+        }
+        const hasMore = boot && boot.total > items.length;
 
         EquipmentApp.locationsCache = locations;
         const locMap = {};
         locations.forEach(l => locMap[l.id] = l.name);
 
-        // Stats
-        const inMaint = items.filter(i => i.status === 'Maintenance').length;
-        const broken = items.filter(i => i.status === 'Broken' || i.status === 'Retired').length;
+        // Stats (server-rendered stats are already correct when bootstrapped)
+        if (!boot) {
+            const inMaint = items.filter(i => i.status === 'Maintenance').length;
+            const broken = items.filter(i => i.status === 'Broken' || i.status === 'Retired').length;
 
-        document.getElementById('statTotal').innerText = items.length;
-        document.getElementById('statMaint').innerText = inMaint;
-        document.getElementById('statBroken').innerText = broken;
+            document.getElementById('statTotal').innerText = items.length;
+            document.getElementById('statMaint').innerText = inMaint;
+            document.getElementById('statBroken').innerText = broken;
 
-        // Locations Filter
-        locFilter.innerHTML = '<option value="">All Locations</option>';
-        locations.forEach(loc => {
-            const opt = document.createElement('option');
-            opt.value = loc.id;
-            opt.textContent = loc.name;
-            locFilter.appendChild(opt);
-        });
+            // Locations Filter
+            locFilter.innerHTML = '<option value="">All Locations</option>';
+            locations.forEach(loc => {
+                const opt = document.createElement('option');
+                opt.value = loc.id;
+                opt.textContent = loc.name;
+                locFilter.appendChild(opt);
+            });
+        }
 
         const renderTable = (data) => {
             tableBody.innerHTML = '';
@@ -114,7 +161,18 @@ const EquipmentApp = {
 
         searchInput.addEventListener('keyup', filterData);
         locFilter.addEventListener('change', filterData);
-        renderTable(items);
+
+        // Server already painted the first page; only render here if we fetched it ourselves
+        if (!boot) renderTable(items);
+
+        if (hasMore) {
+            // Pull the remaining rows in the background so filtering sees everything
+            EQUIP_API.getPage(items[items.length - 1]).then(rest => {
+                const seen = new Set(items.map(row => row.id));
+                items.push(...rest.filter(row => !seen.has(row.id)));
+                if (searchInput.value || locFilter.value) filterData();
+            }).catch(err => console.error('Failed to load remaining equipment', err));
+        }
     },
 
     showDetails: async (id) => {
@@ -159,7 +217,14 @@ const EquipmentApp = {
 
     initForm: async () => {
         const locSelect = document.getElementById('location_id');
-        const locations = await EQUIP_API.getLocations();
+        const urlParams = new URLSearchParams(window.location.search);
+        const editId = urlParams.get('id');
+
+        // Locations and the item being edited come back in a single request
+        const paths = ['/api/locations'];
+        if (editId) paths.push(`/api/equipments/${editId}`);
+        const [locRes, itemRes] = await EQUIP_API.batch(paths);
+        const locations = locRes.body;
 
         locations.forEach(loc => {
             const opt = document.createElement('option');
@@ -168,13 +233,10 @@ const EquipmentApp = {
             locSelect.appendChild(opt);
         });
 
-        const urlParams = new URLSearchParams(window.location.search);
-        const editId = urlParams.get('id');
-
         if (editId) {
             document.getElementById('pageTitle').textContent = "Edit Equipment";
-            const item = await EQUIP_API.getById(editId);
-            if (item && !item.error) {
+            const item = itemRes.body;
+            if (itemRes.status === 200) {
                 document.getElementById('itemId').value = item.id;
                 document.getElementById('name').value = item.name;
                 document.getElementById('manufacturer').value = item.manufacturer || '';
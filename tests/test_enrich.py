@@ -0,0 +1,237 @@
+"""
+Offline tests for enrich.py, using ai_provider.FakeProvider instead of Gemini.
+The resume test needs the PostgreSQL schema and is skipped without it.
+"""
+import json
+import uuid
+
+import pytest
+from psycopg2.extras import execute_values
+
+import ai_provider
+import enrich
+from app import DatabaseUnavailable, get_db_connection
+
+
+@pytest.fixture(autouse=True)
+def reset_breaker(monkeypatch):
+    ai_provider.breaker.record_success()
+    monkeypatch.setattr(enrich.time, 'sleep', lambda seconds: None)
+    yield
+    ai_provider.breaker.record_success()
+
+
+def row(id, name='Acetone', needs_cas=True, needs_notes=True):
+    return {'id': id, 'name': name, 'formula': None, 'needs_cas': needs_cas, 'needs_notes': needs_notes}
+
+
+# --- VALIDATION ---
+
+def test_valid_cas_checks_format_and_check_digit():
+    assert enrich.valid_cas('67-64-1')
+    assert enrich.valid_cas('7732-18-5')
+    assert not enrich.valid_cas('67-64-2')
+    assert not enrich.valid_cas('67641')
+    assert not enrich.valid_cas('1-64-1')
+
+
+def test_parse_response_keeps_only_valid_needed_fields():
+    rows = [row(1), row(2, needs_cas=False), row(3)]
+    text = '```json\n' + json.dumps([
+        {'id': 1, 'cas_number': '67-64-1', 'safety_notes': '  Highly   flammable. '},
+        {'id': 2, 'cas_number': '64-17-5', 'safety_notes': 'Flammable.'},
+        {'id': 3, 'cas_number': '67-64-2', 'safety_notes': ''},
+        {'id': 99, 'cas_number': '67-64-1', 'safety_notes': 'Not asked for'},
+        'garbage',
+    ]) + '\n```'
+
+    results, rejected = enrich.parse_response(text, rows)
+
+    assert results == {1: ('67-64-1', 'Highly flammable.'), 2: (None, 'Flammable.')}
+    assert rejected == 3
+
+
+def test_parse_response_rejects_non_arrays():
+    with pytest.raises(ValueError):
+        enrich.parse_response('{"id": 1}', [row(1)])
+    with pytest.raises(ValueError):
+        enrich.parse_response('Sorry, I cannot help with that.', [row(1)])
+
+
+def test_chunk_rows_bounds_items_and_prompt_size():
+    rows = [row(i, name='x' * 50) for i in range(1, 24)]
+    chunks = list(enrich.chunk_rows(rows, batch_size=10))
+    assert [len(c) for c in chunks] == [10, 10, 3]
+
+    small = list(enrich.chunk_rows(rows, batch_size=10, max_chars=len(enrich.build_prompt([])) + 200))
+    assert all(len(enrich.build_prompt(c)) <= len(enrich.build_prompt([])) + 200 for c in small)
+    assert sum(len(c) for c in small) == len(rows)
+
+
+def test_fake_backend_round_trip():
+    rows = [row(1, 'Acetone'), row(2, 'Unobtainium')]
+    text = enrich.fake_response(enrich.build_prompt(rows))
+    results, rejected = enrich.parse_response(text, rows)
+    assert results[1][0] == '67-64-1'
+    assert results[2] == (None, 'Handle with standard lab precautions.')
+    assert rejected == 0
+
+
+# --- RETRIES ---
+
+def test_enrich_chunk_retries_until_a_valid_reply():
+    replies = iter(['not json', RuntimeError('boom')])
+
+    def responder(prompt):
+        reply = next(replies, None)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply if reply is not None else enrich.fake_response(prompt)
+
+    provider = ai_provider.FakeProvider(responder)
+    results, _ = enrich.enrich_chunk(provider, [row(1)], enrich.RateLimiter(0), retries=3)
+    assert results[1][0] == '67-64-1'
+    assert provider.calls == 3
+
+
+def test_enrich_chunk_gives_up_after_retries():
+    provider = ai_provider.FakeProvider(lambda prompt: 'not json')
+    with pytest.raises(enrich.PromptFailed):
+        enrich.enrich_chunk(provider, [row(1)], enrich.RateLimiter(0), retries=2)
+    assert provider.calls == 3
+    # Bad replies are the prompt's fault, not an outage
+    assert ai_provider.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('error', [ai_provider.AIContentError('blocked'), ValueError('no text')])
+def test_enrich_chunk_treats_raised_content_errors_as_prompt_failures(error):
+    def responder(prompt):
+        raise error
+
+    provider = ai_provider.FakeProvider(responder)
+    with pytest.raises(enrich.PromptFailed):
+        enrich.enrich_chunk(provider, [row(1)], enrich.RateLimiter(0), retries=3)
+    assert provider.calls == 4
+    assert ai_provider.breaker.state == 'closed'
+
+
+def test_enrich_chunk_reports_outages_as_fatal():
+    provider = ai_provider.FakeProvider(lambda prompt: 'unused', failure_rate=1.0)
+    with pytest.raises(enrich.EnrichmentError) as info:
+        enrich.enrich_chunk(provider, [row(1)], enrich.RateLimiter(0), retries=3)
+    assert not isinstance(info.value, enrich.PromptFailed)
+    # Three failures open the breaker; the last attempt fails fast without a call
+    assert provider.calls == 3
+    assert ai_provider.breaker.state == 'open'
+
+
+# --- RESUMING (needs PostgreSQL) ---
+
+@pytest.fixture
+def lab():
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        pytest.skip('PostgreSQL is not available')
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1 FROM enrichment_failures LIMIT 0")
+        cursor.execute("INSERT INTO labs (name) VALUES (%s) RETURNING id", (f"test-{uuid.uuid4().hex[:8]}",))
+    except Exception:
+        conn.close()
+        pytest.skip('Schema is not loaded (run setup_postgres.py)')
+    lab_id = cursor.fetchone()[0]
+    conn.commit()
+    yield conn, lab_id
+    job = enrich.job_name(lab_id)
+    cursor.execute("DELETE FROM enrichment_failures WHERE job = %s", (job,))
+    cursor.execute("DELETE FROM enrichment_progress WHERE job = %s", (job,))
+    cursor.execute("DELETE FROM chemicals WHERE lab_id = %s", (lab_id,))
+    cursor.execute("DELETE FROM labs WHERE id = %s", (lab_id,))
+    conn.commit()
+    conn.close()
+
+
+def test_run_resumes_records_failures_and_retries_them(lab):
+    conn, lab_id = lab
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO chemicals (lab_id, name, cas_number, quantity, unit, safety_notes)
+        SELECT %s, CASE WHEN g = 7 THEN 'Poison' ELSE 'Acetone' END, '', 1, 'g',
+               CASE WHEN g = 3 THEN 'Typed by a user' END
+        FROM generate_series(1, 200) g
+    """, (lab_id,))
+    conn.commit()
+
+    def flaky(prompt):
+        if '"Poison"' in prompt:
+            return 'not json'
+        return enrich.fake_response(prompt)
+
+    provider = ai_provider.FakeProvider(flaky)
+    first = enrich.run(batch_size=30, limit=60, lab_id=lab_id, provider=provider, rate_per_minute=0, retries=1)
+    assert first['processed'] == 60
+    # The Poison row's whole prompt (30 chemicals) failed and was skipped, not retried forever
+    assert first['failed'] == 30
+    assert first['updated'] == 30
+
+    # Resumes after the checkpoint; a 140-row page is counted in full
+    second = enrich.run(batch_size=30, lab_id=lab_id, provider=provider, rate_per_minute=0, retries=1)
+    assert second['processed'] == 140
+    assert second['updated'] == 140
+    assert enrich.run(lab_id=lab_id, dry_run=True)['pending'] == 0
+
+    cursor.execute("SELECT safety_notes FROM chemicals WHERE lab_id = %s ORDER BY id OFFSET 2 LIMIT 1", (lab_id,))
+    assert cursor.fetchone()[0] == 'Typed by a user'
+
+    retry = enrich.run(batch_size=1, lab_id=lab_id, provider=provider, rate_per_minute=0, retries=1,
+                       retry_failed=True)
+    assert retry['updated'] == 29
+    assert retry['failed'] == 1
+    cursor.execute("SELECT COUNT(*) FROM enrichment_failures WHERE job = %s", (enrich.job_name(lab_id),))
+    assert cursor.fetchone()[0] == 1
+    conn.commit()
+
+
+def add_chemicals(conn, lab_id, names):
+    cursor = conn.cursor()
+    execute_values(cursor, "INSERT INTO chemicals (lab_id, name, cas_number, quantity, unit) VALUES %s",
+                   [(lab_id, name, '', 1, 'g') for name in names])
+    conn.commit()
+    cursor.close()
+
+
+def test_run_skips_prompts_whose_generation_raises(lab):
+    conn, lab_id = lab
+    add_chemicals(conn, lab_id, ['Acetone', 'Poison', 'Acetone'])
+
+    def blocked(prompt):
+        if '"Poison"' in prompt:
+            raise ai_provider.AIContentError('Response was blocked')
+        return enrich.fake_response(prompt)
+
+    provider = ai_provider.FakeProvider(blocked)
+    stats = enrich.run(batch_size=1, lab_id=lab_id, provider=provider, rate_per_minute=0, retries=3)
+    assert stats == {'processed': 3, 'updated': 2, 'rejected': 0, 'failed': 1}
+    assert ai_provider.breaker.state == 'closed'
+    # The checkpoint moved past the blocked chemical
+    assert enrich.run(lab_id=lab_id, dry_run=True)['pending'] == 0
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM enrichment_failures WHERE job = %s", (enrich.job_name(lab_id),))
+    assert cursor.fetchone()[0] == 1
+    conn.commit()
+
+
+def test_run_stops_without_checkpointing_when_the_service_is_down(lab):
+    conn, lab_id = lab
+    add_chemicals(conn, lab_id, ['Acetone', 'Ethanol'])
+
+    provider = ai_provider.FakeProvider(enrich.fake_response, failure_rate=1.0)
+    with pytest.raises(enrich.EnrichmentError) as info:
+        enrich.run(batch_size=1, lab_id=lab_id, provider=provider, rate_per_minute=0, retries=1)
+    assert not isinstance(info.value, enrich.PromptFailed)
+    assert enrich.run(lab_id=lab_id, dry_run=True)['pending'] == 2
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM enrichment_failures WHERE job = %s", (enrich.job_name(lab_id),))
+    assert cursor.fetchone()[0] == 0
+    conn.commit()